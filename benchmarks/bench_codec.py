@@ -0,0 +1,108 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  bench_codec.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Encode and decode throughput of each installed codec.
+
+Payloads are shaped like the setup bodies the client sends and receives:
+a SchemaDataType with a large JSON schema, and a fetch response with a
+page of data types.
+
+    python -m benchmarks.bench_codec [rounds]
+"""
+
+import sys
+import time
+
+from cenit import codec
+
+
+def _schema(fields):
+    return {
+        "type": "object",
+        "title": "Order",
+        "properties": dict(("field_%d" % i, {
+            "type": ("string", "integer", "number", "boolean")[i % 4],
+            "title": u"Field nº %d" % i,
+            "description": "Value of field %d as sent by the partner" % i,
+            "default": None,
+            "edi": {"segment": "SEG%d" % (i % 20), "position": i},
+        }) for i in range(fields)),
+        "required": ["field_%d" % i for i in range(0, fields, 5)],
+    }
+
+
+def payloads():
+    schema_data_type = {"schema_data_type": {
+        "library": {"id": "5f2b8c0e0000000000000001"},
+        "name": "order",
+        "title": "Order",
+        "slug": "order",
+        "_type": "Setup::SchemaDataType",
+        "schema": _schema(400),
+    }}
+
+    fetch_page = {"data_type": [{
+        "id": "5f2b8c0e%016x" % i,
+        "library": {"id": "5f2b8c0e0000000000000001"},
+        "name": "type_%d" % i,
+        "title": u"Type %d – partner feed" % i,
+        "slug": "type_%d" % i,
+        "_type": "Setup::SchemaDataType",
+        "schema": _schema(20),
+    } for i in range(100)]}
+
+    return (("schema", schema_data_type), ("fetch page", fetch_page))
+
+
+def _timed(func, arg, rounds):
+    start = time.time()
+    for _ in range(rounds):
+        func(arg)
+    return (time.time() - start) / rounds * 1000
+
+
+def main(rounds=50):
+    codecs = [codec.SimpleJsonCodec()]
+    if codec.ujson is not None:
+        codecs.append(codec.UltraJsonCodec())
+
+    exact = {"float": 0.1 + 0.2, "big": 2 ** 64, "small": -2 ** 63 - 1}
+    for c in codecs:
+        assert c.dumps(exact) == codec.SimpleJsonCodec().dumps(exact)
+        assert c.loads(c.dumps(exact)) == exact
+
+    for label, payload in payloads():
+        for c in codecs:
+            body = c.dumps(payload)
+            assert codec.SimpleJsonCodec().loads(body) == \
+                codec.SimpleJsonCodec().loads(c.dumps(c.loads(body)))
+            print "%-10s %-10s %7d bytes  encode %6.2fms  decode %6.2fms" % (
+                label, c.name, len(body), _timed(c.dumps, payload, rounds),
+                _timed(c.loads, body, rounds))
+
+    print "default codec: %s" % (codec.default_codec().name,)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,76 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  bench_compression.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Bytes on the wire pushing and fetching large schemas, with and without
+gzip.
+
+    python -m benchmarks.bench_compression [pushes]
+"""
+
+import sys
+import time
+
+from cenit import api
+from cenit.compression import Compression
+from benchmarks.bench_codec import payloads
+from benchmarks.server import CenitStandIn
+
+
+def run(client, pushes):
+    body = dict(payloads())["schema"]
+    start = time.time()
+    for _ in range(pushes):
+        client.post("setup/schema_data_type",
+                    body["schema_data_type"])
+        client.get("setup/schema_data_type",
+                   {"page": 1, "limit": 10})
+    return time.time() - start
+
+
+def main(pushes=50):
+    for name, compression, threshold in (
+            ("identity", None, None),
+            ("gzip", Compression(), Compression.DEFAULT_THRESHOLD)):
+        server = CenitStandIn(compress_threshold=threshold).start()
+        api.register_custom_cenit(host=server.host, port=server.port,
+                                  ssl=False)
+        client = api.get_cenit_client()
+        client.set_compression(compression)
+        client.get_traffic().reset()
+
+        elapsed = run(client, pushes)
+
+        stats = client.get_traffic().stats()
+        print "%-9s sent %6.1f/%6.1f MB  received %6.1f/%6.1f MB  " \
+              "(wire/logical)  %.2fs" % (
+                  name, stats['sent_wire'] / 1e6, stats['sent_logical'] / 1e6,
+                  stats['received_wire'] / 1e6,
+                  stats['received_logical'] / 1e6, elapsed)
+
+        client.close()
+        server.stop()
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
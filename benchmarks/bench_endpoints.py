@@ -0,0 +1,113 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  bench_endpoints.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Read throughput across several replicas, and failover when one dies.
+
+Every stand-in replica serves at most CAPACITY requests at a time, so
+throughput can only grow by spreading reads over more of them.
+
+    python -m benchmarks.bench_endpoints [seconds] [replicas]
+"""
+
+import sys
+import threading
+import time
+
+from cenit import api
+from cenit.endpoints import LEAST_OUTSTANDING, ROUND_ROBIN
+from cenit.exceptions import AccessError
+from benchmarks.server import CenitStandIn
+
+
+THREADS = 16
+CAPACITY = 2
+
+
+def _reader(client, stop, counters):
+    while not stop.is_set():
+        try:
+            client.get("setup/library")
+            counters['reads'] += 1
+        except AccessError:
+            counters['errors'] += 1
+
+
+def run(client, seconds, kill=None):
+    stop = threading.Event()
+    counters = {'reads': 0, 'errors': 0}
+    threads = [threading.Thread(target=_reader,
+                                args=(client, stop, counters))
+               for _ in range(THREADS)]
+    for t in threads:
+        t.start()
+    if kill is not None:
+        time.sleep(seconds / 2.0)
+        kill.stop()
+        time.sleep(seconds / 2.0)
+    else:
+        time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return counters['reads'] / float(seconds), counters['errors']
+
+
+def _replicas(count):
+    return [CenitStandIn(latency=0.02, capacity=CAPACITY).start()
+            for _ in range(count)]
+
+
+def main(seconds=3, replicas=4):
+    client = api.get_cenit_client()
+
+    for strategy in (ROUND_ROBIN, LEAST_OUTSTANDING):
+        for count in sorted(set([1, 2, replicas])):
+            servers = _replicas(count)
+            api.register_custom_cenit(
+                ssl=False, pool_maxsize=THREADS, strategy=strategy,
+                endpoints=[(s.host, s.port) for s in servers])
+
+            rate, errors = run(client, seconds)
+            print "%-17s %d replica(s) %7.1f reads/s (%d errors)" % (
+                strategy, count, rate, errors)
+
+            client.close()
+            for server in servers:
+                server.stop()
+
+    servers = _replicas(replicas)
+    api.register_custom_cenit(ssl=False, pool_maxsize=THREADS,
+                              endpoints=[(s.host, s.port) for s in servers])
+    rate, errors = run(client, seconds, kill=servers[0])
+    stats = client.get_endpoints().stats()
+    print "failover          %d replica(s) %7.1f reads/s (%d errors, " \
+          "%d failovers)" % (replicas, rate, errors, stats['failovers'])
+
+    client.close()
+    for server in servers[1:]:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main(*[f(a) for f, a in zip((int, int), sys.argv[1:])])
@@ -0,0 +1,71 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  bench_fetch.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Whole-collection fetch throughput: paged walk vs fetch_parallel workers.
+
+    python -m benchmarks.bench_fetch [records] [latency]
+"""
+
+import sys
+import time
+
+from cenit import api, models
+from benchmarks.server import CenitStandIn
+
+
+PAGE_SIZE = 50
+
+
+def _rate(count, call):
+    start = time.time()
+    objects = call()
+    assert len(objects) == count, (len(objects), count)
+    return count / (time.time() - start)
+
+
+def main(count=5000, latency=0.01):
+    server = CenitStandIn(latency=latency).start()
+    server.seed("parameter", [{"key": "k%d" % i, "value": "v%d" % i}
+                              for i in range(count)])
+
+    api.register_custom_cenit(host=server.host, port=server.port, ssl=False,
+                              pool_maxsize=16)
+    client = api.get_cenit_client()
+
+    walk = _rate(count, lambda: list(models.Parameter.iter_fetch(
+        page_size=PAGE_SIZE, prefetch=0)))
+    print "paged walk:            %10.1f objects/s" % (walk,)
+
+    for workers in (1, 2, 4, 8, 16):
+        rate = _rate(count, lambda: models.Parameter.fetch_parallel(
+            workers=workers, page_size=PAGE_SIZE))
+        print "fetch_parallel(%2d):    %10.1f objects/s  (%.2fx)" % (
+            workers, rate, rate / walk)
+
+    client.close()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main(*[f(a) for f, a in zip((int, float), sys.argv[1:])])
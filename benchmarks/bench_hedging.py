@@ -0,0 +1,81 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  bench_hedging.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""GET tail latency against a backend with an occasional slow reply.
+
+Runs the same sequence of GETs without and with a Hedger.
+
+    python -m benchmarks.bench_hedging [requests] [slow_ratio]
+"""
+
+import sys
+import time
+
+from cenit import api
+from cenit.hedging import Hedger
+from benchmarks.server import CenitStandIn
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(client, requests):
+    latencies = []
+    for _ in range(requests):
+        start = time.time()
+        client.get("setup/library")
+        latencies.append(time.time() - start)
+    return latencies
+
+
+def main(requests=1000, slow_ratio=0.02):
+    server = CenitStandIn(latency=0.002, slow_ratio=slow_ratio,
+                          slow_latency=0.2).start()
+
+    api.register_custom_cenit(host=server.host, port=server.port, ssl=False)
+    client = api.get_cenit_client()
+
+    for name, hedger in (("unhedged", None), ("hedged", Hedger())):
+        client.set_hedger(hedger)
+        latencies = run(client, requests)
+        print "%-9s p50 %6.1fms  p99 %6.1fms  max %6.1fms" % (
+            name, _percentile(latencies, 0.5) * 1000,
+            _percentile(latencies, 0.99) * 1000, max(latencies) * 1000),
+        if hedger is not None:
+            stats = hedger.stats()
+            print "  (%d hedges sent, %d won)" % (stats['hedges_sent'],
+                                                   stats['hedges_won']),
+            hedger.close()
+        print
+
+    client.close()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main(*[f(a) for f, a in zip((int, float), sys.argv[1:])])
@@ -0,0 +1,127 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  bench_memory.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Bytes per hydrated model instance.
+
+Records go through JSON first, so every string is a separate object, as
+in a real response. Two figures are reported per model:
+- deep: the size of everything reachable from the instances, counting
+  shared objects once
+- rss: the growth of a forked child's RSS while records are decoded and
+  hydrated one at a time, the way fetch(stream=True) does
+
+    python -m benchmarks.bench_memory [instances]
+"""
+
+import gc
+import os
+import sys
+import types
+
+import simplejson
+
+from cenit.models import Connection, FileDataType, Library, Parameter, \
+    SchemaDataType, Webhook
+from benchmarks import suite
+
+
+MODELS = (Library, SchemaDataType, FileDataType, Parameter, Connection,
+          Webhook)
+
+_SKIP = (type, types.ModuleType, types.FunctionType, types.MethodType,
+         types.BuiltinFunctionType, types.ClassType)
+
+
+def deep_size(objects, exclude=()):
+    """Bytes reachable from objects, not counting through exclude"""
+    seen = set(id(x) for x in exclude)
+    pending = list(objects)
+    total = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, _SKIP):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return total
+
+
+def _rss():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+
+
+def _bodies(model, count):
+    libraries = max(1, count // 100)
+    return [simplejson.dumps(suite.fixture(model, i, 10, libraries))
+            for i in range(count)]
+
+
+def _hydrate(model, bodies):
+    objects = []
+    for body in bodies:
+        objects.extend(model.from_values([simplejson.loads(body)]))
+    return objects
+
+
+def measure(model, count):
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        suite.hydrate_dependencies(model, count, 10)
+        bodies = _bodies(model, count)
+        gc.collect()
+
+        base = _rss()
+        objects = _hydrate(model, bodies)
+        gc.collect()
+        rss = _rss() - base
+
+        # Libraries are shared by the data types, not part of them.
+        libraries = [o.library for o in objects if hasattr(o, 'library')]
+        deep = deep_size(objects, exclude=libraries)
+        os.write(write, "%d %d" % (deep, rss))
+        os._exit(0)
+
+    os.close(write)
+    rc = os.read(read, 1024)
+    os.close(read)
+    os.waitpid(pid, 0)
+    deep, rss = [int(x) for x in rc.split()]
+    return deep / float(count), rss / float(count)
+
+
+def main(count=20000):
+    for model in MODELS:
+        deep, rss = measure(model, count)
+        print "%-15s deep %7.0f bytes/instance   rss %7.0f bytes/instance" % (
+            model.__name__, deep, rss)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
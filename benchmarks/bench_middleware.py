@@ -0,0 +1,65 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  bench_middleware.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Per-request cost of the middleware chain.
+
+    python -m benchmarks.bench_middleware [requests]
+"""
+
+import sys
+import time
+
+from cenit import api
+from cenit.middleware import Metrics, Tracing
+from benchmarks.server import CenitStandIn
+
+
+def run(client, requests):
+    start = time.time()
+    for _ in range(requests):
+        client.get("setup/library")
+    return (time.time() - start) / requests * 1e6
+
+
+def main(requests=5000):
+    server = CenitStandIn().start()
+    api.register_custom_cenit(host=server.host, port=server.port, ssl=False)
+    client = api.get_cenit_client()
+    run(client, 100)
+
+    for name, chain in (("none", ()),
+                        ("metrics", (Metrics(),)),
+                        ("metrics+tracing", (Metrics(), Tracing()))):
+        for middleware in client.get_middleware():
+            client.remove_middleware(middleware)
+        for middleware in chain:
+            client.add_middleware(middleware)
+        print "%-16s %7.1fus per request" % (name, run(client, requests))
+
+    client.close()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
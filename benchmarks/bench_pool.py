@@ -0,0 +1,70 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  bench_pool.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Requests per second with one-shot ``requests.get`` vs the pooled client.
+
+    python -m benchmarks.bench_pool [requests] [latency]
+"""
+
+import sys
+import time
+
+import requests
+
+from cenit import api
+from benchmarks.server import CenitStandIn
+
+
+def _rate(count, call):
+    start = time.time()
+    for _ in range(count):
+        call()
+    return count / (time.time() - start)
+
+
+def main(count=2000, latency=0.0):
+    server = CenitStandIn(latency=latency).start()
+    server.seed("parameter", [{"key": "k%d" % i, "value": "v%d" % i}
+                              for i in range(10)])
+
+    api.register_custom_cenit(host=server.host, port=server.port, ssl=False)
+    client = api.get_cenit_client()
+
+    url = "http://{}:{}/api/v1/setup/parameter".format(server.host,
+                                                       server.port)
+    headers = {'Content-Type': 'application/json'}
+
+    before = _rate(count, lambda: requests.get(url, headers=headers).json())
+    after = _rate(count, lambda: client.get("setup/parameter"))
+
+    print "one-shot requests.get: %10.1f req/s" % (before,)
+    print "pooled _RawV1.get:     %10.1f req/s" % (after,)
+    print "speedup:               %10.2fx" % (after / before,)
+
+    client.close()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main(*[f(a) for f, a in zip((int, float), sys.argv[1:])])
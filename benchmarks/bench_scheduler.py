@@ -0,0 +1,127 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  bench_scheduler.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Interactive latency while a bulk job saturates a rate limited tenant.
+
+Runs the same workload without and with a RequestScheduler whose rate is
+set well above the stand-in's limit, so it has to discover the limit.
+
+    python -m benchmarks.bench_scheduler [seconds] [rate_limit]
+"""
+
+import sys
+import threading
+import time
+
+from cenit import api
+from cenit.exceptions import AccessError
+from cenit.scheduler import BULK, RequestScheduler
+from benchmarks.server import CenitStandIn
+
+
+BULK_THREADS = 16
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _bulk(client, stop, counters):
+    with api.request_priority(BULK):
+        while not stop.is_set():
+            try:
+                client.get("setup/parameter", {"page": 1, "limit": 10})
+                counters['bulk'] += 1
+            except AccessError:
+                counters['bulk_errors'] += 1
+
+
+def _interactive(client, stop, latencies, counters):
+    while not stop.is_set():
+        start = time.time()
+        try:
+            client.get("setup/library")
+            latencies.append(time.time() - start)
+        except AccessError:
+            counters['interactive_errors'] += 1
+        time.sleep(0.02)
+
+
+def run(client, seconds):
+    stop = threading.Event()
+    latencies = []
+    counters = {'bulk': 0, 'bulk_errors': 0, 'interactive_errors': 0}
+
+    threads = [threading.Thread(target=_bulk, args=(client, stop, counters))
+               for _ in range(BULK_THREADS)]
+    threads.append(threading.Thread(target=_interactive,
+                                    args=(client, stop, latencies, counters)))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    return {
+        'bulk_rate': counters['bulk'] / float(seconds),
+        'bulk_errors': counters['bulk_errors'],
+        'interactive_p50': _percentile(latencies, 0.5),
+        'interactive_p99': _percentile(latencies, 0.99),
+        'interactive_errors': counters['interactive_errors'],
+    }
+
+
+def main(seconds=5, rate_limit=200):
+    server = CenitStandIn(latency=0.005, rate_limit=rate_limit).start()
+    server.seed("parameter", [{"key": "k%d" % i, "value": "v"}
+                              for i in range(10)])
+
+    api.register_custom_cenit(host=server.host, port=server.port, ssl=False,
+                              pool_maxsize=BULK_THREADS + 1)
+    client = api.get_cenit_client()
+
+    for name, scheduler in (
+            ("unscheduled", None),
+            ("scheduled", RequestScheduler(rate=rate_limit * 3))):
+        client.set_scheduler(scheduler)
+        server.throttled = 0
+        time.sleep(1)
+
+        rc = run(client, seconds)
+        print "%-12s bulk %7.1f req/s (%d errors, %d throttled)  " \
+              "interactive p50 %.1fms p99 %.1fms (%d errors)" % (
+                  name, rc['bulk_rate'], rc['bulk_errors'], server.throttled,
+                  rc['interactive_p50'] * 1000, rc['interactive_p99'] * 1000,
+                  rc['interactive_errors'])
+
+    client.close()
+    server.stop()
+
+
+if __name__ == '__main__':
+    main(*[f(a) for f, a in zip((int, int), sys.argv[1:])])
@@ -0,0 +1,121 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  bench_stream.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Peak memory of a large fetch, loaded whole and streamed.
+
+The stand-in runs in its own process. Each measurement runs in a freshly
+forked child and reports how far its peak RSS rose above its RSS at the
+start, so one run cannot inflate the next.
+
+    python -m benchmarks.bench_stream [libraries] [per_library]
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+
+from cenit import api
+from cenit.models import Library, SchemaDataType
+from benchmarks.server import CenitStandIn
+
+
+def _serve(conn, libraries, per_library):
+    server = CenitStandIn()
+    for l in range(libraries):
+        library = server.create("library", {"name": "lib%d" % l,
+                                            "slug": "lib%d" % l})
+        server.seed("schema_data_type", [{
+            "library": {"id": library["id"]},
+            "name": "type_%d_%d" % (l, i),
+            "slug": "type_%d_%d" % (l, i),
+            "title": "Type %d %d" % (l, i),
+            "_type": "Setup::SchemaDataType",
+            "schema": {"type": "object", "properties": dict(
+                ("field_%d" % f, {"type": "string", "title": "Field %d" % f})
+                for f in range(20))},
+        } for i in range(per_library)])
+    conn.send((server.host, server.port))
+    server.serve_forever()
+
+
+def _status(field):
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+
+
+def _measure(func):
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        base = _status("VmRSS")
+        start = time.time()
+        count = func()
+        elapsed = time.time() - start
+        os.write(write, "%d %d %f" % (_status("VmHWM") - base, count,
+                                      elapsed))
+        os._exit(0)
+
+    os.close(write)
+    rc = os.read(read, 1024)
+    os.close(read)
+    os.waitpid(pid, 0)
+    peak, count, elapsed = rc.split()
+    return int(peak), int(count), float(elapsed)
+
+
+def main(libraries=100, per_library=200):
+    conn, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_serve,
+                                     args=(child, libraries, per_library))
+    server.daemon = True
+    server.start()
+    host, port = conn.recv()
+
+    api.register_custom_cenit(host=host, port=port, ssl=False)
+    client = api.get_cenit_client()
+    Library.fetch()
+
+    hook = "setup/{}".format(SchemaDataType.root)
+    scenarios = (
+        ("get", lambda: len(
+            client.get(hook, {})[SchemaDataType.root])),
+        ("get_stream", lambda: sum(
+            1 for _ in client.get_stream(hook, SchemaDataType.root, {}))),
+        ("fetch", lambda: len(SchemaDataType.fetch())),
+        ("fetch(stream)", lambda: len(SchemaDataType.fetch(stream=True))),
+    )
+    for name, func in scenarios:
+        peak, count, elapsed = _measure(func)
+        print "%-14s %6d entries  peak +%7.1f MB  %6.2fs" % (
+            name, count, peak / 1e6, elapsed)
+
+    server.terminate()
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
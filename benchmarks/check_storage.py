@@ -0,0 +1,109 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  check_storage.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Round-trip models with nested models through a SqliteStorage.
+
+Data types, Connections, Webhooks and ConnectionRoles are persisted, then
+rehydrated into a fresh storage both by load() and by get_instance(), and
+must come back with the same state. A row that cannot be rebuilt must be
+skipped without stopping load().
+
+    python -m benchmarks.check_storage
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from cenit import api
+from cenit.models import Connection, ConnectionRole, FileDataType, \
+    Library, Parameter, SchemaDataType, Webhook
+from cenit.storage import SqliteStorage
+
+
+def _models():
+    library = Library("Lib", slug="lib", id_="l1")
+    files = FileDataType(library, "Files", title="Stored files", id_="f1")
+    schema = SchemaDataType(library, "Order", '{"type": "object"}', id_="s1")
+
+    conn = Connection(
+        "conn", "http://example.com", namespace="ns", id_="c1",
+        parameters=[Parameter("k", "v", id_="p1")],
+        headers=[Parameter("Accept", "*/*", id_="p2")],
+        template_parameters=[Parameter("t", "1", id_="p3")],
+        token="secret")
+    hook = Webhook(
+        "hook", "/hook", "post", namespace="ns", id_="w1",
+        parameters=[Parameter("q", "x", id_="p4")],
+        headers=[Parameter("X-Hook", "y", id_="p5")])
+    role = ConnectionRole("role", namespace="ns", id_="r1",
+                          connections=[conn], webhooks=[hook])
+    return [library, files, schema, conn, hook, role]
+
+
+def _check(expected, fetch):
+    for obj in expected:
+        got = fetch(type(obj), obj.id)
+        assert got is not None, "%s was not rehydrated" % (obj,)
+        assert got.to_dict(expand=True) == obj.to_dict(expand=True), \
+            (got.to_dict(expand=True), obj.to_dict(expand=True))
+
+    for key, value in (("p1", "v"), ("p2", "*/*"), ("p4", "x")):
+        param = Parameter.get_instance(key)
+        assert param is not None and param.value == value, param
+
+
+def main():
+    client = api.get_cenit_client()
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, "instances.db")
+    try:
+        client.set_storage(SqliteStorage(path))
+        expected = _models()
+        client.flush_instances()
+
+        db = sqlite3.connect(path)
+        db.execute("INSERT INTO instances VALUES (?, ?, 1, 0, ?)",
+                   (SqliteStorage._model(FileDataType), "broken", "{}"))
+        db.commit()
+        db.close()
+
+        client.set_storage(SqliteStorage(path))
+        count = client.get_storage().load()
+        _check(expected, lambda cls, key: cls.get_instance(key))
+        assert client.get_storage().skipped == 1
+        print "load(): %d instances round-tripped, 1 bad row skipped" % (
+            count,)
+
+        client.set_storage(SqliteStorage(path))
+        _check(expected, lambda cls, key: cls.get_instance(key))
+        print "get_instance(): round-tripped"
+    finally:
+        client.set_storage(None)
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  loadgen.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Synthetic load against a Cenit deployment, driven through the models.
+
+    python -m benchmarks.loadgen --mix Library.fetch=70,Webhook.push=20,\
+Webhook.drop=10 --concurrency 16 --duration 30 --host cenit.example.com \
+--key KEY --token TOKEN
+
+    python -m benchmarks.loadgen --stand-in --rate 200 --duration 10
+
+Operations are <Model>.fetch, <Model>.push and <Model>.drop. They are
+picked at random in proportion to their weight in --mix.
+
+With --concurrency N, N workers each run one operation after another
+(closed loop). With --rate R, R operations per second are started on
+schedule, whatever the latency (open loop). Each operation's latency is
+then counted from when it was due, so time spent queued behind slow
+ones is included. Fetches read one page of --page-size records. Pushes
+create new objects from the suite's fixtures. Drops remove objects
+pushed earlier, pushing one first if none is left.
+
+--stand-in runs against a local stand-in seeded with fixtures, and the
+exit status is 1 when the error rate exceeds --max-error-rate, which
+suits CI.
+"""
+
+import Queue
+import argparse
+import itertools
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+import simplejson
+
+from cenit import api, models
+from benchmarks import suite
+
+
+OPERATIONS = ('fetch', 'push', 'drop')
+
+
+class Workload(object):
+    """Weighted mix of model operations"""
+
+    def __init__(self, mix, page_size=50, size=10):
+        self.operations = []
+        self.weights = []
+        for name, weight in mix:
+            model_name, _, operation = name.partition(".")
+            model = getattr(models, model_name, None)
+            if not isinstance(model, type) or \
+                    not issubclass(model, api.CenitModel):
+                raise ValueError("Unknown model %s" % (model_name,))
+            if operation not in OPERATIONS:
+                raise ValueError("Unknown operation %s" % (name,))
+            self.operations.append((name, model, operation))
+            self.weights.append(weight)
+
+        self.page_size = page_size
+        self.size = size
+
+        self.__pushed = dict((model, deque())
+                             for _, model, _ in self.operations)
+        self.__ids = itertools.count(int(time.time() * 1000) % 10 ** 9)
+
+    def pick(self, rng):
+        point = rng.uniform(0, sum(self.weights))
+        for operation, weight in zip(self.operations, self.weights):
+            point -= weight
+            if point <= 0:
+                return operation
+        return self.operations[-1]
+
+    def __new_object(self, model):
+        record = suite.fixture(model, next(self.__ids), self.size)
+        return model.from_values([record])[0]
+
+    def prepare(self, model, operation):
+        """What operation needs done beforehand, outside its timing"""
+        if operation == 'drop':
+            try:
+                return self.__pushed[model].popleft()
+            except IndexError:
+                obj = self.__new_object(model)
+                obj.push()
+                return obj
+        if operation == 'push':
+            return self.__new_object(model)
+        return None
+
+    def run(self, model, operation, obj):
+        if operation == 'fetch':
+            model.fetch(cache=False, page=1, limit=self.page_size)
+        elif operation == 'push':
+            if not obj.push():
+                raise api.ValidationError()
+            self.__pushed[model].append(obj)
+        elif not obj.drop():
+            raise api.ValidationError()
+
+
+class Recorder(object):
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, name, latency, error=None):
+        with self.__lock:
+            if error is None:
+                self.latencies.setdefault(name, []).append(latency)
+            else:
+                errors = self.errors.setdefault(name, {})
+                key = type(error).__name__
+                errors[key] = errors.get(key, 0) + 1
+
+
+def _execute(workload, recorder, operation, due=None):
+    name, model, kind = operation
+    try:
+        obj = workload.prepare(model, kind)
+        start = time.time() if due is None else due
+        workload.run(model, kind, obj)
+        recorder.record(name, time.time() - start)
+    except Exception as e:
+        recorder.record(name, None, e)
+
+
+def closed_loop(workload, recorder, concurrency, duration, seed):
+    stop = time.time() + duration
+
+    def _worker(n):
+        rng = random.Random(seed + n)
+        while time.time() < stop:
+            _execute(workload, recorder, workload.pick(rng))
+
+    workers = [threading.Thread(target=_worker, args=(n,))
+               for n in range(concurrency)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+
+def open_loop(workload, recorder, rate, concurrency, duration, seed):
+    rng = random.Random(seed)
+    due = Queue.Queue()
+
+    def _worker():
+        while True:
+            job = due.get()
+            if job is None:
+                return
+            scheduled, operation = job
+            delay = scheduled - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            _execute(workload, recorder, operation, scheduled)
+
+    workers = [threading.Thread(target=_worker) for _ in range(concurrency)]
+    for w in workers:
+        w.start()
+
+    start = time.time()
+    for n in xrange(int(rate * duration)):
+        scheduled = start + n / float(rate)
+        # Keep at most a second of work queued ahead of the clock.
+        ahead = scheduled - time.time() - 1
+        if ahead > 0:
+            time.sleep(ahead)
+        due.put((scheduled, workload.pick(rng)))
+
+    for _ in workers:
+        due.put(None)
+    for w in workers:
+        w.join()
+
+
+def _percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def summarize(recorder, elapsed):
+    rc = {'elapsed': elapsed, 'operations': {}}
+    total = errors = 0
+    names = set(recorder.latencies) | set(recorder.errors)
+    for name in sorted(names):
+        latencies = sorted(recorder.latencies.get(name, []))
+        failed = sum(recorder.errors.get(name, {}).values())
+        stats = {
+            'ok': len(latencies),
+            'errors': recorder.errors.get(name, {}),
+            'throughput': len(latencies) / elapsed,
+        }
+        if latencies:
+            for p in (0.5, 0.9, 0.99):
+                stats['p%d_ms' % (p * 100)] = \
+                    _percentile(latencies, p) * 1000
+            stats['max_ms'] = latencies[-1] * 1000
+        rc['operations'][name] = stats
+        total += len(latencies)
+        errors += failed
+
+    rc['throughput'] = total / elapsed
+    rc['error_rate'] = errors / float(total + errors) if total + errors \
+        else 0.0
+    return rc
+
+
+def _print_summary(rc):
+    out = sys.stderr
+    out.write("%-24s %8s %8s %10s %9s %9s %9s %9s\n" % (
+        "operation", "ok", "errors", "ops/s", "p50 ms", "p90 ms", "p99 ms",
+        "max ms"))
+    for name, stats in sorted(rc['operations'].items()):
+        out.write("%-24s %8d %8d %10.1f" % (
+            name, stats['ok'], sum(stats['errors'].values()),
+            stats['throughput']))
+        if stats['ok']:
+            out.write(" %9.1f %9.1f %9.1f %9.1f" % (
+                stats['p50_ms'], stats['p90_ms'], stats['p99_ms'],
+                stats['max_ms']))
+        out.write("\n")
+    out.write("total %.1f ops/s, error rate %.2f%%\n" % (
+        rc['throughput'], rc['error_rate'] * 100))
+
+
+def _mix(text):
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix.append((name.strip(), float(weight or 1)))
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--mix", type=_mix,
+                        default=_mix("Library.fetch=70,Webhook.push=20,"
+                                     "Webhook.drop=10"),
+                        help="Model.operation=weight,... "
+                             "(default: %(metavar)s)", metavar="MIX")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, default=8,
+                      help="workers running operations back to back")
+    load.add_argument("--rate", type=float,
+                      help="operations started per second")
+    parser.add_argument("--workers", type=int, default=64,
+                        help="most operations in flight at once with --rate")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds of load")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--size", type=int, default=10,
+                        help="fixture size of pushed objects")
+    parser.add_argument("--seed", type=int, default=0)
+
+    target = parser.add_argument_group("target")
+    target.add_argument("--stand-in", action="store_true",
+                        help="run against a local stand-in server")
+    target.add_argument("--stand-in-latency", type=float, default=0.0)
+    target.add_argument("--records", type=int, default=1000,
+                        help="fixtures per model seeded in the stand-in")
+    target.add_argument("--host")
+    target.add_argument("--port", type=int)
+    target.add_argument("--path")
+    target.add_argument("--no-ssl", action="store_true")
+    target.add_argument("--key")
+    target.add_argument("--token")
+
+    parser.add_argument("--json", help="also write the summary here")
+    parser.add_argument("--max-error-rate", type=float, default=0.0)
+    options = parser.parse_args(argv)
+
+    workload = Workload(options.mix, options.page_size, options.size)
+    concurrency = options.workers if options.rate else options.concurrency
+
+    server = None
+    host, port, ssl = options.host, options.port, not options.no_ssl
+    if options.stand_in:
+        conn, child = multiprocessing.Pipe()
+        server = multiprocessing.Process(target=suite.serve, args=(
+            child, argparse.Namespace(latency=options.stand_in_latency,
+                                      records=options.records,
+                                      size=options.size)))
+        server.daemon = True
+        server.start()
+        (host, port), ssl = conn.recv(), False
+
+    api.register_custom_cenit(host=host, port=port, path=options.path,
+                              ssl=ssl, pool_maxsize=concurrency)
+    client = api.get_cenit_client()
+    if options.key:
+        client.set_credentials(options.key, options.token)
+
+    for _, model, _ in workload.operations:
+        suite.hydrate_dependencies(model, options.records, options.size)
+
+    recorder = Recorder()
+    start = time.time()
+    if options.rate:
+        open_loop(workload, recorder, options.rate, concurrency,
+                  options.duration, options.seed)
+    else:
+        closed_loop(workload, recorder, concurrency, options.duration,
+                    options.seed)
+    rc = summarize(recorder, time.time() - start)
+    rc.update({'mix': dict(options.mix), 'rate': options.rate,
+               'concurrency': concurrency})
+
+    _print_summary(rc)
+    if options.json:
+        with open(options.json, "w") as out:
+            simplejson.dump(rc, out, indent=2, sort_keys=True)
+
+    client.close()
+    if server is not None:
+        server.terminate()
+    return 1 if rc['error_rate'] > options.max_error_rate else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,290 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  server.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""In-process stand-in for the Cenit ``setup/<root>`` API.
+
+Only meant for benchmarks: records live in memory and every response is
+JSON over a keep-alive HTTP/1.1 connection. Credentials are not checked;
+the access key only partitions records into tenants.
+"""
+
+import BaseHTTPServer
+import SocketServer
+import hashlib
+import itertools
+import random
+import threading
+import time
+import urlparse
+import zlib
+from collections import OrderedDict
+
+import simplejson
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    # Buffer each response into a single write so keep-alive clients do not
+    # stall on delayed ACKs between the status line, headers and body.
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def parse_request(self):
+        # A stopped stand-in hangs up on keep-alive connections too.
+        if self.server.stopped:
+            self.close_connection = 1
+            return False
+        return BaseHTTPServer.BaseHTTPRequestHandler.parse_request(self)
+
+    def _route(self):
+        url = urlparse.urlparse(self.path)
+        prefix = "/{}/setup/".format(self.server.path)
+        if not url.path.startswith(prefix):
+            return None, None, {}
+
+        parts = url.path[len(prefix):].strip("/").split("/")
+        root = parts[0]
+        id_ = parts[1] if len(parts) > 1 else None
+        params = dict(urlparse.parse_qsl(url.query))
+        return root, id_, params
+
+    @property
+    def _tenant(self):
+        return self.headers.get('X-User-Access-Key')
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else ""
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        return simplejson.loads(body) if body else {}
+
+    def _reply(self, status, values, etag=False):
+        body = simplejson.dumps(values)
+
+        headers = {'Content-Type': 'application/json'}
+        if etag:
+            headers['ETag'] = '"%s"' % (hashlib.md5(body).hexdigest(),)
+            if self.headers.get('If-None-Match') == headers['ETag']:
+                status, body = 304, ""
+
+        threshold = self.server.compress_threshold
+        if threshold is not None and len(body) >= threshold and \
+                'gzip' in self.headers.get('Accept-Encoding', ''):
+            gzip = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = gzip.compress(body) + gzip.flush()
+            headers['Content-Encoding'] = 'gzip'
+        headers['Content-Length'] = str(len(body))
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self._reply(404, {'code': 404})
+
+    def _throttle(self):
+        self.server.delay()
+        if self.server.admit(self._tenant):
+            return False
+        self._reply(429, {'code': 429})
+        return True
+
+    def do_GET(self):
+        if self._throttle():
+            return
+        root, id_, params = self._route()
+        if not root:
+            return self._not_found()
+
+        records = self.server.select(root, params, self._tenant)
+        self._reply(200, {root: records}, etag=True)
+
+    def do_POST(self):
+        if self._throttle():
+            return
+        root, id_, params = self._route()
+        values = self._read_body()
+        if not root or id_:
+            return self._not_found()
+
+        if root == "push":
+            success = dict((k, self.server.seed(k, v, self._tenant))
+                           for k, v in values.items())
+            return self._reply(200, {'success': success})
+
+        record = self.server.create(root, values, self._tenant)
+        self._reply(200, {'success': {root: record}})
+
+    def do_PUT(self):
+        if self._throttle():
+            return
+        root, id_, params = self._route()
+        values = self._read_body()
+        if not root or not id_:
+            return self._not_found()
+
+        record = self.server.update(root, id_, values, self._tenant)
+        if record is None:
+            return self._not_found()
+        self._reply(200, {'success': {root: record}})
+
+    def do_DELETE(self):
+        if self._throttle():
+            return
+        root, id_, params = self._route()
+        if not root or not id_ or \
+                not self.server.delete(root, id_, self._tenant):
+            return self._not_found()
+
+        self._reply(200, {})
+
+
+class CenitStandIn(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, host="127.0.0.1", port=0, path="api/v1", latency=0.0,
+                 rate_limit=None, slow_ratio=0.0, slow_latency=0.0,
+                 capacity=None, compress_threshold=None):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), _Handler)
+
+        self.path = path
+        self.latency = latency
+        self.slow_ratio = slow_ratio
+        self.slow_latency = slow_latency
+        self.capacity = capacity
+        self.compress_threshold = compress_threshold
+        self.rate_limit = rate_limit
+        self.throttled = 0
+        self.stopped = False
+
+        self.__buckets = {}
+        self.__workers = threading.Semaphore(capacity) if capacity else None
+
+        self.__records = {}
+        self.__ids = itertools.count(1)
+        self.__lock = threading.Lock()
+        self.__thread = None
+
+    @property
+    def host(self):
+        return self.server_address[0]
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        self.shutdown()
+        self.server_close()
+
+    def delay(self):
+        """Simulated work; at most capacity requests do it at once"""
+        if self.__workers is None:
+            return self.__work()
+        with self.__workers:
+            self.__work()
+
+    def __work(self):
+        if self.slow_ratio and random.random() < self.slow_ratio:
+            time.sleep(self.slow_latency)
+        elif self.latency:
+            time.sleep(self.latency)
+
+    def admit(self, tenant):
+        """Whether tenant is still within rate_limit requests per second"""
+        if not self.rate_limit:
+            return True
+
+        burst = max(1.0, self.rate_limit / 10.0)
+        now = time.time()
+        with self.__lock:
+            tokens, stamp = self.__buckets.get(tenant, (burst, now))
+            tokens = min(burst, tokens + (now - stamp) * self.rate_limit)
+            admitted = tokens >= 1
+            if admitted:
+                tokens -= 1
+            else:
+                self.throttled += 1
+            self.__buckets[tenant] = (tokens, now)
+        return admitted
+
+    def seed(self, root, records, tenant=None):
+        return [self.create(root, values, tenant) for values in records]
+
+    def select(self, root, filters, tenant=None):
+        filters = dict(filters)
+        page = int(filters.pop("page", 1))
+        limit = int(filters.pop("limit", 0))
+
+        with self.__lock:
+            records = self.__records.get((tenant, root), {}).values()
+
+        if filters:
+            records = [r for r in records if all(unicode(r.get(k)) == v
+                                                 for k, v in filters.items())]
+
+        if limit:
+            records = records[(page - 1) * limit:page * limit]
+        return records
+
+    def create(self, root, values, tenant=None):
+        record = dict(values)
+        with self.__lock:
+            # Seeded records may bring their own ids.
+            if not record.get('id'):
+                record['id'] = "%024x" % (next(self.__ids),)
+            records = self.__records.setdefault((tenant, root), OrderedDict())
+            records[record['id']] = record
+        return record
+
+    def update(self, root, id_, values, tenant=None):
+        with self.__lock:
+            record = self.__records.get((tenant, root), {}).get(id_)
+            if record is not None:
+                record.update(values)
+                record['id'] = id_
+        return record
+
+    def delete(self, root, id_, tenant=None):
+        with self.__lock:
+            records = self.__records.get((tenant, root), {})
+            return records.pop(id_, None) is not None
@@ -0,0 +1,106 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  stress_threads.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Hammer fetch/push/drop from many threads against the stand-in server.
+
+Each thread pushes its own Parameters, fetches them back, drops half of
+them, and checks the identity map and the server agree with what it did.
+
+    python -m benchmarks.stress_threads [threads] [rounds] [latency]
+"""
+
+import sys
+import threading
+import time
+
+from cenit import api, models
+from benchmarks.server import CenitStandIn
+
+
+def _worker(n, rounds, errors):
+    try:
+        for i in range(rounds):
+            key = "t%d-%d" % (n, i)
+
+            param = models.Parameter(key, "v")
+            assert param.push(), "push failed: %s" % (key,)
+            assert models.Parameter.get_instance(param.id) is param
+
+            fetched = models.Parameter.fetch(key=key)
+            assert [p.id for p in fetched] == [param.id], fetched
+            assert models.Parameter.get_instance(param.id) is fetched[0]
+
+            if i % 2:
+                assert fetched[0].drop(), "drop failed: %s" % (key,)
+                assert models.Parameter.get_instance(param.id) is None
+    except Exception as e:
+        errors.append((n, repr(e)))
+
+
+def run(server, threads, rounds):
+    errors = []
+    workers = [threading.Thread(target=_worker, args=(n, rounds, errors))
+               for n in range(threads)]
+
+    start = time.time()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.time() - start
+
+    expected = threads * (rounds - rounds // 2)
+    stored = len(server.select("parameter", {}))
+    if stored != expected:
+        errors.append(("server", "%d records, expected %d" % (stored,
+                                                              expected)))
+    return threads * rounds * 3 / elapsed, errors
+
+
+def main(threads=32, rounds=50, latency=0.005):
+    server = CenitStandIn(latency=latency).start()
+    api.register_custom_cenit(host=server.host, port=server.port, ssl=False,
+                              pool_maxsize=threads)
+    client = api.get_cenit_client()
+
+    failed = False
+    for count in sorted(set([1, threads // 4 or 1, threads])):
+        for root in ("parameter",):
+            for record in server.select(root, {}):
+                server.delete(root, record['id'])
+
+        rate, errors = run(server, count, rounds)
+        print "%3d threads: %10.1f ops/s  %d errors" % (count, rate,
+                                                         len(errors))
+        for error in errors[:5]:
+            print "    ", error
+        failed = failed or bool(errors)
+
+    client.close()
+    server.stop()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[f(a) for f, a in zip((int, int, float), sys.argv[1:])]))
@@ -0,0 +1,410 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  suite.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Benchmark suite covering every model against the stand-in server.
+
+For each model in cenit.models it runs these scenarios:
+- hydrate: from_values on prepared records
+- to_dict
+- fetch: the whole collection in one request
+- fetch_stream: the same with fetch(stream=True)
+- push: one object at a time
+- drop: the objects just pushed
+
+Each scenario runs in a freshly forked child. The stand-in runs in a
+process of its own, so scenarios do not share identity maps or memory.
+The report is JSON: operations per second, per-operation latency
+percentiles for push and drop, and the peak RSS growth of the scenario.
+Any error is recorded against its scenario, and the suite carries on.
+
+    python -m benchmarks.suite [--records N] [--size N] [--latency S]
+                               [--model NAME ...] [--scenario NAME ...]
+                               [--output FILE]
+    python -m benchmarks.suite --compare BASE.json NEW.json [--threshold F]
+"""
+
+import argparse
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import simplejson
+
+from cenit import api
+from cenit.models import Connection, ConnectionRole, Event, FileDataType, \
+    Library, Observer, Parameter, Schema, SchemaDataType, Webhook
+from benchmarks.server import CenitStandIn
+
+
+SCENARIOS = ('hydrate', 'to_dict', 'fetch', 'fetch_stream', 'push', 'drop')
+
+MODELS = (Library, Schema, SchemaDataType, FileDataType, Parameter,
+          Connection, Webhook, ConnectionRole, Event, Observer)
+
+# Seeded and hydrated ahead of the models referencing them.
+DEPENDENCIES = {
+    Schema: (Library,),
+    SchemaDataType: (Library,),
+    FileDataType: (Library,),
+    Observer: (Library, SchemaDataType),
+}
+
+# Higher is better for these; lower for everything else compared.
+THROUGHPUT = ('ops_per_sec',)
+
+
+################################################################################
+# Fixtures
+################################################################################
+
+def _id(model, i):
+    return "%08x%016x" % (MODELS.index(model) + 1, i)
+
+
+def _parameters(prefix, size):
+    return [{"key": "%s_%d" % (prefix, i), "value": "v" * 16}
+            for i in range(size)]
+
+
+def _schema(size):
+    return {"type": "object", "properties": dict(
+        ("field_%d" % f, {"type": "string", "title": "Field %d" % f})
+        for f in range(size))}
+
+
+def _connection(i, size):
+    return {"namespace": "bench", "name": "connection_%d" % i,
+            "url": "https://example.com/%d" % i, "number": "n%d" % i,
+            "token": "t%d" % i,
+            "parameters": _parameters("p", size),
+            "headers": _parameters("h", size),
+            "template_parameters": _parameters("t", size)}
+
+
+def _webhook(i, size):
+    return {"namespace": "bench", "name": "webhook_%d" % i,
+            "path": "/hooks/%d" % i, "method": "post",
+            "parameters": _parameters("p", size),
+            "headers": _parameters("h", size),
+            "template_parameters": _parameters("t", size)}
+
+
+def fixture(model, i, size, libraries=1):
+    """Record i of model as the Cenit API returns it, without an id"""
+    library = {"id": _id(Library, i % libraries)}
+
+    if model is Library:
+        return {"name": "library_%d" % i, "slug": "library_%d" % i}
+    if model is Schema:
+        return {"library": library, "uri": "schema_%d.json" % i,
+                "slug": simplejson.dumps(_schema(size))}
+    if model is SchemaDataType:
+        return {"library": library, "name": "type_%d" % i,
+                "slug": "type_%d" % i, "title": "Type %d" % i,
+                "_type": "Setup::SchemaDataType", "schema": _schema(size)}
+    if model is FileDataType:
+        return {"library": library, "name": "file_%d" % i,
+                "slug": "file_%d" % i, "title": "File %d" % i,
+                "_type": "Setup::FileDataType"}
+    if model is Parameter:
+        return {"key": "key_%d" % i, "value": "v" * (size * 8)}
+    if model is Connection:
+        return _connection(i, size)
+    if model is Webhook:
+        return _webhook(i, size)
+    if model is ConnectionRole:
+        return {"namespace": "bench", "name": "role_%d" % i,
+                "connections": [_connection(i, size)],
+                "webhooks": [_webhook(i, size)]}
+    if model is Event:
+        return {"namespace": "bench", "name": "event_%d" % i}
+    if model is Observer:
+        return {"namespace": "bench", "name": "observer_%d" % i,
+                "triggers": '{"name": {"$present": true}}',
+                "data_type": {"id": _id(SchemaDataType, i)}}
+    raise ValueError(model)
+
+
+def fixtures(model, count, size):
+    """count records of model as the Cenit API returns them"""
+    libraries = max(1, count // 100)
+
+    records = []
+    for i in range(count):
+        record = fixture(model, i, size, libraries)
+        record["id"] = _id(model, i)
+        records.append(record)
+    return records
+
+
+def hydrate_dependencies(model, count, size):
+    """Hydrate the fixtures model's own fixtures refer to"""
+    for dependency in DEPENDENCIES.get(model, ()):
+        dependency.from_values(fixtures(dependency, count, size))
+
+
+def _unsaved(records):
+    return [dict((k, v) for k, v in r.items() if k != "id") for r in records]
+
+
+################################################################################
+# Stand-in
+################################################################################
+
+def serve(conn, options):
+    """Serve every model's fixtures; conn receives the stand-in's address"""
+    server = CenitStandIn(latency=options.latency)
+    for model in MODELS:
+        records = fixtures(model, options.records, options.size)
+        server.seed(model.root, records)
+    conn.send((server.host, server.port))
+    server.serve_forever()
+
+
+################################################################################
+# Measurement
+################################################################################
+
+def _status(field):
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+
+
+def _reset_peak():
+    # Linux 4.0+ resets VmHWM to the current RSS on this write.
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except IOError:
+        pass
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _timed(func, items):
+    latencies = []
+    for item in items:
+        start = time.time()
+        func(item)
+        latencies.append(time.time() - start)
+    return latencies
+
+
+def _scenario(model, scenario, options):
+    """Run scenario in this process and return its measurements"""
+    hydrate_dependencies(model, options.records, options.size)
+    records = fixtures(model, options.records, options.size)
+    latencies = None
+
+    if scenario == 'hydrate':
+        _reset_peak()
+        base, start = _status("VmRSS"), time.time()
+        count = len(model.from_values(records))
+    elif scenario == 'to_dict':
+        objects = model.from_values(records)
+        _reset_peak()
+        base, start = _status("VmRSS"), time.time()
+        count = len([o.to_dict() for o in objects])
+    elif scenario in ('fetch', 'fetch_stream'):
+        _reset_peak()
+        base, start = _status("VmRSS"), time.time()
+        count = len(model.fetch(cache=False,
+                                stream=scenario == 'fetch_stream'))
+    else:
+        objects = model.from_values(_unsaved(records))
+        if scenario == 'drop':
+            for obj in objects:
+                obj.push()
+        _reset_peak()
+        base, start = _status("VmRSS"), time.time()
+        latencies = _timed(lambda o: getattr(o, scenario)(), objects)
+        count = len(objects)
+
+    elapsed = time.time() - start
+    rc = {
+        'count': count,
+        'seconds': elapsed,
+        'ops_per_sec': count / elapsed if elapsed else None,
+        'peak_rss_bytes': _status("VmHWM") - base,
+    }
+    if latencies is not None:
+        for p in (0.5, 0.9, 0.99):
+            rc['p%d_ms' % (p * 100)] = _percentile(latencies, p) * 1000
+    return rc
+
+
+def _isolated(model, scenario, options):
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        try:
+            rc = _scenario(model, scenario, options)
+        except Exception as e:
+            rc = {'error': "%s: %s" % (type(e).__name__, e)}
+        with os.fdopen(write, "w") as out:
+            out.write(simplejson.dumps(rc))
+        os._exit(0)
+
+    os.close(write)
+    with os.fdopen(read) as inp:
+        rc = inp.read()
+    os.waitpid(pid, 0)
+    return simplejson.loads(rc) if rc else {'error': "scenario crashed"}
+
+
+def _revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(options):
+    conn, child = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=serve, args=(child, options))
+    server.daemon = True
+    server.start()
+    host, port = conn.recv()
+
+    api.register_custom_cenit(host=host, port=port, ssl=False)
+
+    results = []
+    for model in MODELS:
+        if options.model and model.__name__ not in options.model:
+            continue
+        for scenario in SCENARIOS:
+            if options.scenario and scenario not in options.scenario:
+                continue
+            rc = _isolated(model, scenario, options)
+            rc.update({'model': model.__name__, 'scenario': scenario})
+            results.append(rc)
+            _print_row(rc)
+
+    server.terminate()
+    return {
+        'revision': _revision(),
+        'python': platform.python_version(),
+        'timestamp': time.time(),
+        'options': {'records': options.records, 'size': options.size,
+                    'latency': options.latency},
+        'results': results,
+    }
+
+
+def _print_row(rc):
+    if 'error' in rc:
+        detail = "error: %s" % (rc['error'],)
+    else:
+        detail = "%6d ops  %10.1f ops/s  peak +%7.1f MB" % (
+            rc['count'], rc['ops_per_sec'] or 0, rc['peak_rss_bytes'] / 1e6)
+        if 'p99_ms' in rc:
+            detail += "  p50 %.1fms p99 %.1fms" % (rc['p50_ms'],
+                                                   rc['p99_ms'])
+    sys.stderr.write("%-15s %-13s %s\n" % (rc['model'], rc['scenario'],
+                                           detail))
+
+
+################################################################################
+# Comparison
+################################################################################
+
+def compare(base, new, threshold):
+    """Lines for every metric that got worse by more than threshold"""
+    before = dict(((r['model'], r['scenario']), r) for r in base['results'])
+    lines = []
+    for rc in new['results']:
+        old = before.get((rc['model'], rc['scenario']))
+        if old is None:
+            continue
+        if 'error' in rc and 'error' not in old:
+            lines.append("%s %s: now fails (%s)" % (rc['model'],
+                                                    rc['scenario'],
+                                                    rc['error']))
+            continue
+        for metric in ('ops_per_sec', 'p50_ms', 'p99_ms', 'peak_rss_bytes'):
+            a, b = old.get(metric), rc.get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / float(a)
+            if metric in THROUGHPUT:
+                change = -change
+            if change > threshold:
+                lines.append("%s %s: %s %.4g -> %.4g (%+.0f%% worse)" % (
+                    rc['model'], rc['scenario'], metric, a, b,
+                    change * 100))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--records", type=int, default=1000,
+                        help="records per model")
+    parser.add_argument("--size", type=int, default=10,
+                        help="schema fields, parameters per list, etc.")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="stand-in latency per request, in seconds")
+    parser.add_argument("--model", action="append",
+                        help="only this model (repeatable)")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="only this scenario (repeatable)")
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"),
+                        help="list regressions between two reports")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative change counted as a regression")
+    options = parser.parse_args(argv)
+
+    if options.compare:
+        with open(options.compare[0]) as base, \
+                open(options.compare[1]) as new:
+            lines = compare(simplejson.load(base), simplejson.load(new),
+                            options.threshold)
+        print "\n".join(lines) or "No regressions"
+        return 1 if lines else 0
+
+    report = simplejson.dumps(run(options), indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as out:
+            out.write(report)
+    else:
+        print report
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -22,19 +22,46 @@
 #
 #
 
+import binascii
+import functools
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
 import requests
-import simplejson
+from requests.adapters import HTTPAdapter
+
+from cache import QueryCache, ResponseCache, SingleFlight
+from codec import Codec, default_codec, iter_array
+from compression import Compression, TrafficCounter
+from endpoints import ROUND_ROBIN, EndpointPool, parse_endpoint
+from exceptions import AccessError, ValidationError, UnauthorizedError, \
+    RequestTimeoutError
+from forks import PerProcess
+from hedging import Hedger
+import logs
+from middleware import Exchange, Middleware
+from scheduler import BULK, INTERACTIVE, RequestScheduler
 
-from exceptions import AccessError, ValidationError, UnauthorizedError
+
+_logger = logging.getLogger(__name__)
 
 
 class _Singleton(type):
     _instances = {}
+    _lock = threading.Lock()
 
     def __call__(cls, *args, **kwargs):
         if cls not in cls._instances:
-            cls._instances[cls] = super(_Singleton, cls).__call__(*args,
-                                                                  **kwargs)
+            with _Singleton._lock:
+                if cls not in cls._instances:
+                    cls._instances[cls] = super(_Singleton, cls).__call__(
+                        *args, **kwargs)
         return cls._instances[cls]
 
 
@@ -50,14 +77,32 @@ class Storage(object):
     def set_instance(self, cls, key, instance):
         raise NotImplementedError
 
+    def flush(self):
+        """Called once the instances set so far are fully hydrated"""
+        pass
+
 
 class _InternalStorage(Storage):
 
+    # Writers are serialized per class through a fixed set of lock stripes,
+    # so hydrating different models never contends on a single lock. Reads
+    # are single dict lookups and need no lock.
+    _locks = [threading.Lock() for _ in range(16)]
+
+    def __init__(self, instances=None):
+        self.__instances = Storage._instances if instances is None \
+            else instances
+
+    @classmethod
+    def _lock_for(cls, model):
+        return cls._locks[hash(model) % len(cls._locks)]
+
     def drop_instance(self, cls, key):
-        Storage._instances.get(cls, {}).pop(key)
+        with self._lock_for(cls):
+            self.__instances.get(cls, {}).pop(key)
 
     def get_instance(self, cls, key):
-        return Storage._instances.get(cls, {}).get(key, None)
+        return self.__instances.get(cls, {}).get(key, None)
 
     def set_instance(self, cls, key, instance):
         assert issubclass(cls, CenitModel), \
@@ -65,9 +110,63 @@ class _InternalStorage(Storage):
         assert isinstance(instance, CenitModel), \
             "Object %s must be instance of CenitModel" % (instance,)
 
-        if cls not in Storage._instances:
-            Storage._instances[cls] = {}
-        Storage._instances[cls][key] = instance
+        with self._lock_for(cls):
+            self.__instances.setdefault(cls, {})[key] = instance
+
+
+def _make_storage(storage, default):
+    if storage is None:
+        return default()
+    if isinstance(storage, type):
+        assert issubclass(storage, Storage), \
+            "Class %s must be subclass of %s" % (storage, Storage)
+        return storage()
+
+    assert isinstance(storage, Storage), \
+        "Object %s must be instance of %s" % (storage, Storage)
+    return storage
+
+
+class _Context(threading.local):
+    clients = ()
+    priority = INTERACTIVE
+    deadline = None
+    trace = None
+
+
+_context = _Context()
+
+
+def _bind_context(func):
+    """Wrap func to run with the calling thread's client context"""
+    state = dict(vars(_context))
+
+    def _bound(*args, **kwargs):
+        saved = dict(vars(_context))
+        vars(_context).clear()
+        vars(_context).update(state)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            vars(_context).clear()
+            vars(_context).update(saved)
+
+    return _bound
+
+
+def _deadline_passed():
+    return _context.deadline is not None and _context.deadline <= time.time()
+
+
+def _time_left():
+    """Seconds left before this thread's deadline, None if there is none"""
+    if _context.deadline is None:
+        return None
+
+    left = _context.deadline - time.time()
+    if left <= 0:
+        raise RequestTimeoutError()
+    return left
 
 
 class _RawV1(object):
@@ -78,59 +177,329 @@ class _RawV1(object):
     DEFAULT_HOST = "cenithub.com"
     DEFAULT_PATH = "api/v1"
 
+    DEFAULT_POOL_CONNECTIONS = 10
+    DEFAULT_POOL_MAXSIZE = 10
+
+    DEFAULT_CONNECT_TIMEOUT = 10
+    DEFAULT_READ_TIMEOUT = 60
+
     PUSH_HOOK = "setup/push"
+    PUSH_BATCH_SIZE = 100
 
-    def __init__(self, host=None, port=None, path=None, ssl=True, verify=True,
-                 storage=None):
-        self.__host = host or _RawV1.DEFAULT_HOST
-        self.__port = port
-        self.__path = path or _RawV1.DEFAULT_PATH
-        self.__scheme = _RawV1.DEFAULT_SCHEME if ssl else "http"
+    PAGE_PARAM = "page"
+    LIMIT_PARAM = "limit"
+    PAGE_SIZE = 100
 
-        self.__verify = verify
+    STREAM_CHUNK_SIZE = 64 * 1024
 
-        self.__key = None
-        self.__token = None
+    def __init__(self, host=None, port=None, path=None, ssl=True, verify=True,
+                 storage=None, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, keep_alive=True,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, endpoints=None,
+                 strategy=ROUND_ROBIN):
+        self.__session = PerProcess(self.__new_session)
+        self.__session_lock = threading.Lock()
+
+        self.configure(host, port, path, ssl, verify,
+                       pool_connections=pool_connections,
+                       pool_maxsize=pool_maxsize, keep_alive=keep_alive,
+                       connect_timeout=connect_timeout,
+                       read_timeout=read_timeout, endpoints=endpoints,
+                       strategy=strategy)
+
+        self.__credentials = (None, None)
 
         self.__storage = None
         self.set_storage(storage)
 
-    def __get_url(self, hook):
-        return "{scheme}://{host}{port}/{path}/{hook}".format(
-            scheme=self.__scheme,
-            host=self.__host,
-            port="" if not self.__port else ":{}".format(self.__port),
-            path=self.__path,
-            hook=hook,
-        )
-
-    def __get_headers(self):
+        self.__response_cache = None
+        self.__query_cache = None
+        self.__single_flight = None
+        self.__scheduler = None
+        self.__hedger = None
+        self.__codec = default_codec()
+        self.__compression = None
+        self.__traffic = TrafficCounter()
+        self.__middleware = ()
+
+    def configure(self, host=None, port=None, path=None, ssl=True,
+                  verify=True, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                  pool_maxsize=DEFAULT_POOL_MAXSIZE, keep_alive=True,
+                  connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                  read_timeout=DEFAULT_READ_TIMEOUT, endpoints=None,
+                  strategy=ROUND_ROBIN):
+        """Point the client at host, or at every replica in endpoints"""
+        path = path or _RawV1.DEFAULT_PATH
+        scheme = _RawV1.DEFAULT_SCHEME if ssl else "http"
+
+        if not endpoints:
+            endpoints = [(host or _RawV1.DEFAULT_HOST, port)]
+        pool = EndpointPool([parse_endpoint(e, path, scheme)
+                             for e in endpoints], strategy)
+
+        with self.__session_lock:
+            self.__endpoints = pool
+
+            self.__verify = verify
+
+            self.__pool_connections = pool_connections
+            self.__pool_maxsize = pool_maxsize
+            self.__keep_alive = keep_alive
+
+            self.__connect_timeout = connect_timeout
+            self.__read_timeout = read_timeout
+
+        self.__session.discard()
+
+    def get_endpoints(self):
+        return self.__endpoints
+
+    def __get_headers(self, credentials):
         headers = {'Content-Type': 'application/json'}
 
-        if self.__key and self.__token:
+        key, token = credentials
+        if key and token:
             headers.update({
-                'X-User-Access-Key': self.__key,
-                'X-User-Access-Token': self.__token,
+                'X-User-Access-Key': key,
+                'X-User-Access-Token': token,
             })
 
         return headers
 
+    # A session inherited through os.fork() shares its sockets with the
+    # parent process, so the child leaves it alone and opens its own pool.
+    def __new_session(self):
+        with self.__session_lock:
+            adapter = HTTPAdapter(pool_connections=self.__pool_connections,
+                                  pool_maxsize=self.__pool_maxsize)
+
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.verify = self.__verify
+
+            if not self.__keep_alive:
+                session.headers['Connection'] = 'close'
+
+        return session
+
+    def __send(self, method, hook, **kwargs):
+        pool = self.__endpoints
+        tried = []
+        while True:
+            endpoint = pool.checkout(tried)
+            try:
+                r = self.__send_to(endpoint, method, hook, **kwargs)
+            except AccessError as e:
+                if isinstance(e, RequestTimeoutError) and _deadline_passed():
+                    # The caller ran out of time; that says nothing about
+                    # the replica, and there is no time left to fail over.
+                    pool.checkin(endpoint, None)
+                    raise
+                pool.checkin(endpoint, False)
+                tried.append(endpoint)
+                # Only reads are safe to repeat on another replica; a
+                # write may already have been applied before it failed.
+                if method != "GET" or len(tried) >= len(pool):
+                    raise
+                continue
+
+            healthy = r.status_code < 500
+            pool.checkin(endpoint, healthy)
+            tried.append(endpoint)
+            if healthy or method != "GET" or len(tried) >= len(pool):
+                return r
+
+    def __send_to(self, endpoint, method, hook, **kwargs):
+        url = endpoint.url(hook)
+
+        scheduler = self.__scheduler
+        if scheduler is None:
+            return self.__exchange(endpoint, method, hook, url, 0, **kwargs)
+
+        key = "{}/{}".format(endpoint.netloc,
+                             kwargs['headers'].get('X-User-Access-Key', ''))
+        for attempt in itertools.count():
+            if not scheduler.acquire(key, _context.priority, _time_left()):
+                raise RequestTimeoutError()
+
+            start = time.time()
+            r = self.__exchange(endpoint, method, hook, url, attempt,
+                                **kwargs)
+            retry = scheduler.feedback(key, r.status_code,
+                                       time.time() - start,
+                                       r.headers.get('Retry-After'))
+            if not retry or attempt >= scheduler.max_retries:
+                return r
+
+    def __exchange(self, endpoint, method, hook, url, attempt, **kwargs):
+        chain = self.__middleware
+        if not chain:
+            return self.__transmit(method, url, **kwargs)
+
+        kwargs['headers'] = dict(kwargs['headers'])
+        exchange = Exchange(method, url, endpoint.netloc, hook,
+                            kwargs['headers'], attempt=attempt,
+                            stream=kwargs.get('stream', False),
+                            sent_bytes=len(kwargs.get('data') or ''),
+                            trace=_context.trace)
+        for middleware in chain:
+            middleware.before_request(exchange)
+
+        exchange.start = time.time()
+        try:
+            r = self.__transmit(method, url, **kwargs)
+        except Exception as e:
+            exchange.elapsed = time.time() - exchange.start
+            for middleware in reversed(chain):
+                middleware.on_error(exchange, e)
+            raise
+
+        exchange.elapsed = time.time() - exchange.start
+        for middleware in reversed(chain):
+            middleware.after_response(exchange, r)
+        return r
+
+    def __transmit(self, method, url, **kwargs):
+        connect, read = self.__connect_timeout, self.__read_timeout
+
+        left = _time_left()
+        if left is not None:
+            connect = min(connect or left, left)
+            read = min(read or left, left)
+
+        try:
+            r = self.__session.get().request(method, url,
+                                             timeout=(connect, read),
+                                             **kwargs)
+        except requests.Timeout as e:
+            raise RequestTimeoutError()
+        except Exception as e:
+            raise AccessError()
+
+        # Streamed bodies are counted by whoever reads them.
+        if not kwargs.get('stream'):
+            self.__traffic.received(r.raw.tell(), len(r.content))
+        return r
+
+    def __encode(self, values, headers):
+        payload = self.__codec.dumps(values)
+
+        body, encoding = payload, None
+        if self.__compression is not None:
+            body, encoding = self.__compression.compress(payload)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+
+        self.__traffic.sent(len(body), len(payload))
+        return body
+
+    def close(self):
+        """Release the pooled connections owned by this process"""
+        session = self.__session.discard()
+        if session is not None:
+            session.close()
+
+    # Credentials are swapped as a single tuple so a request never pairs the
+    # key of one set_credentials() call with the token of another.
     def set_credentials(self, key, token):
-        self.__key = key
-        self.__token = token
+        self.__credentials = (key, token)
 
     def unset_credentials(self):
-        self.__key = None
-        self.__token = None
+        self.__credentials = (None, None)
 
-    def set_storage(self, storage):
-        if storage is not None:
-            assert issubclass(storage, Storage), \
-                "Class %s must be subclass of %s" % (storage, Storage)
-        else:
-            storage = _InternalStorage()
+    def get_credentials(self):
+        return self.__credentials
 
-        self.__storage = storage
+    def set_storage(self, storage):
+        self.__storage = _make_storage(storage, _InternalStorage)
+
+    def get_storage(self):
+        return self.__storage
+
+    def set_response_cache(self, cache):
+        if cache is not None:
+            assert isinstance(cache, ResponseCache), \
+                "Object %s must be instance of %s" % (cache, ResponseCache)
+        self.__response_cache = cache
+
+    def get_response_cache(self):
+        return self.__response_cache
+
+    def set_query_cache(self, cache):
+        if cache is not None:
+            assert isinstance(cache, QueryCache), \
+                "Object %s must be instance of %s" % (cache, QueryCache)
+        self.__query_cache = cache
+
+    def get_query_cache(self):
+        return self.__query_cache
+
+    def set_single_flight(self, single_flight):
+        """Coalesce identical concurrent GETs; they share one parsed body"""
+        if single_flight is not None:
+            assert isinstance(single_flight, SingleFlight), \
+                "Object %s must be instance of %s" % (single_flight,
+                                                       SingleFlight)
+        self.__single_flight = single_flight
+
+    def get_single_flight(self):
+        return self.__single_flight
+
+    def set_scheduler(self, scheduler):
+        if scheduler is not None:
+            assert isinstance(scheduler, RequestScheduler), \
+                "Object %s must be instance of %s" % (scheduler,
+                                                       RequestScheduler)
+        self.__scheduler = scheduler
+
+    def get_scheduler(self):
+        return self.__scheduler
+
+    def set_codec(self, codec):
+        assert isinstance(codec, Codec), \
+            "Object %s must be instance of %s" % (codec, Codec)
+        self.__codec = codec
+
+    def get_codec(self):
+        return self.__codec
+
+    def set_compression(self, compression):
+        if compression is not None:
+            assert isinstance(compression, Compression), \
+                "Object %s must be instance of %s" % (compression,
+                                                       Compression)
+        self.__compression = compression
+
+    def get_compression(self):
+        return self.__compression
+
+    def get_traffic(self):
+        return self.__traffic
+
+    def add_middleware(self, middleware):
+        """Run middleware around every request, after those already added"""
+        assert isinstance(middleware, Middleware), \
+            "Object %s must be instance of %s" % (middleware, Middleware)
+        self.__middleware += (middleware,)
+
+    def remove_middleware(self, middleware):
+        self.__middleware = tuple(m for m in self.__middleware
+                                  if m is not middleware)
+
+    def get_middleware(self):
+        return list(self.__middleware)
+
+    def set_hedger(self, hedger):
+        """Hedge slow GETs; other methods are never sent twice"""
+        if hedger is not None:
+            assert isinstance(hedger, Hedger), \
+                "Object %s must be instance of %s" % (hedger, Hedger)
+        self.__hedger = hedger
+
+    def get_hedger(self):
+        return self.__hedger
 
     def drop_instance(self, cls, key):
         return self.__storage.drop_instance(cls, key)
@@ -141,20 +510,54 @@ class _RawV1(object):
     def set_instance(self, cls, key, instance):
         return self.__storage.set_instance(cls, key, instance)
 
-    def get(self, path, params=None):
-        url = self.__get_url(path)
-        headers = self.__get_headers()
+    def flush_instances(self):
+        return self.__storage.flush()
+
+    def get(self, path, params=None, credentials=None):
+        credentials = credentials or self.__credentials
+
+        # Keyed by path so every replica serves the same entries.
+        flight = self.__single_flight
+        if flight is not None:
+            key = flight.key(path, params, *credentials)
+            return flight.do(key, self.__get, (path, params, credentials),
+                             timeout=_time_left())
+
+        return self.__get(path, params, credentials)
+
+    def __get(self, path, params, credentials):
+        headers = self.__get_headers(credentials)
+
+        cache = self.__response_cache
+        if cache is not None:
+            key = cache.key(path, params, *credentials)
+            entry = cache.lookup(key)
+            if entry is not None:
+                if cache.is_fresh(entry):
+                    return entry.value
+                headers.update(entry.conditional_headers())
+
+        hedger = self.__hedger
+        if hedger is not None:
+            send = _bind_context(functools.partial(
+                self.__send, "GET", path, params=params, headers=headers
+            ))
+            r = hedger.run(send)
+        else:
+            r = self.__send("GET", path, params=params, headers=headers)
 
-        try:
-            r = requests.get(url, params=params, headers=headers)
-        except Exception as e:
-            raise AccessError()
+        if cache is not None:
+            if r.status_code == 304 and entry is not None:
+                return cache.revalidate(key, entry)
+            if 200 <= r.status_code < 300:
+                return cache.store(key, self.__codec.loads(r.content),
+                                   r.headers)
 
         if 200 <= r.status_code < 300:
-            return r.json()
+            return self.__codec.loads(r.content)
 
         try:
-            error = r.json()
+            error = self.__codec.loads(r.content)
         except Exception as e:
             raise ValidationError()
 
@@ -163,22 +566,59 @@ class _RawV1(object):
 
         raise ValidationError()
 
-    def post(self, path, values):
-        url = self.__get_url(path)
-        headers = self.__get_headers()
-        payload = simplejson.dumps(values)
+    def get_stream(self, path, root, params=None, credentials=None):
+        """Yield the entries under root as the response body arrives"""
+        headers = self.__get_headers(credentials or self.__credentials)
 
-        print("[POST] %s ? %s (%s)" % (url, payload, headers))
+        r = self.__send("GET", path, params=params, headers=headers,
+                        stream=True)
         try:
-            r = requests.post(url, data=payload, headers=headers)
-        except Exception as e:
-            raise AccessError()
+            if not 200 <= r.status_code < 300:
+                try:
+                    error = self.__codec.loads(r.content)
+                except Exception as e:
+                    raise ValidationError()
+
+                if 400 <= error.get('code', 400) < 500:
+                    raise AccessError()
+
+                raise ValidationError()
+
+            entries = iter_array(self.__counted(r), root)
+            while True:
+                try:
+                    entry = next(entries)
+                except StopIteration:
+                    return
+                except requests.RequestException as e:
+                    raise AccessError()
+                yield entry
+        finally:
+            r.close()
+
+    def __counted(self, r):
+        logical = 0
+        try:
+            for chunk in r.iter_content(self.STREAM_CHUNK_SIZE):
+                logical += len(chunk)
+                yield chunk
+        finally:
+            self.__traffic.received(r.raw.tell(), logical)
+
+    def post(self, path, values, credentials=None):
+        headers = self.__get_headers(credentials or self.__credentials)
+        body = self.__encode(values, headers)
+
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("POST %s ? %s (%s)", path, logs.payload(values),
+                          logs.headers(headers))
+        r = self.__send("POST", path, data=body, headers=headers)
 
         if 200 <= r.status_code < 300:
-            return r.json()
+            return self.__codec.loads(r.content)
 
         try:
-            error = r.json()
+            error = self.__codec.loads(r.content)
         except Exception as e:
             raise ValidationError()
 
@@ -190,21 +630,17 @@ class _RawV1(object):
 
         raise ValidationError()
 
-    def put(self, path, values):
-        url = self.__get_url(path)
-        headers = self.__get_headers()
-        payload = simplejson.dumps(values)
+    def put(self, path, values, credentials=None):
+        headers = self.__get_headers(credentials or self.__credentials)
+        body = self.__encode(values, headers)
 
-        try:
-            r = requests.put(url, data=payload, headers=headers)
-        except Exception as e:
-            raise AccessError()
+        r = self.__send("PUT", path, data=body, headers=headers)
 
         if 200 <= r.status_code < 300:
-            return r.json()
+            return self.__codec.loads(r.content)
 
         try:
-            error = r.json()
+            error = self.__codec.loads(r.content)
         except Exception as e:
             raise ValidationError()
 
@@ -213,24 +649,20 @@ class _RawV1(object):
 
         raise ValidationError()
 
-    def delete(self, path):
-        url = self.__get_url(path)
-        headers = self.__get_headers()
+    def delete(self, path, credentials=None):
+        headers = self.__get_headers(credentials or self.__credentials)
 
-        try:
-            r = requests.delete(url, headers=headers)
-        except Exception as e:
-            raise AccessError()
+        r = self.__send("DELETE", path, headers=headers)
 
         if 200 <= r.status_code < 300:
             return True
 
         try:
-            error = r.json()
+            error = self.__codec.loads(r.content)
         except Exception as e:
             raise ValidationError()
 
-        print ("[DELETE] Error:", error)
+        _logger.debug("DELETE %s failed: %s", path, logs.payload(error))
 
         if 400 <= error.get('code', 400) < 500:
             raise AccessError()
@@ -238,33 +670,351 @@ class _RawV1(object):
         raise ValidationError()
 
 
+class _TenantClient(object):
+    """Credentials, identity map and query cache of a single tenant"""
+
+    def __init__(self, key, token, storage=None):
+        self.__transport = _RawV1()
+        self.__credentials = (key, token)
+
+        self.__storage = None
+        self.set_storage(storage)
+
+        self.__query_cache = None
+
+    def __enter__(self):
+        _context.clients += (self,)
+        return self
+
+    def __exit__(self, *exc_info):
+        _context.clients = _context.clients[:-1]
+
+    def set_credentials(self, key, token):
+        self.__credentials = (key, token)
+
+    def unset_credentials(self):
+        self.__credentials = (None, None)
+
+    def get_credentials(self):
+        return self.__credentials
+
+    def set_storage(self, storage):
+        self.__storage = _make_storage(storage,
+                                       lambda: _InternalStorage({}))
+
+    def get_storage(self):
+        return self.__storage
+
+    def set_query_cache(self, cache):
+        if cache is not None:
+            assert isinstance(cache, QueryCache), \
+                "Object %s must be instance of %s" % (cache, QueryCache)
+        self.__query_cache = cache
+
+    def get_query_cache(self):
+        return self.__query_cache
+
+    def drop_instance(self, cls, key):
+        return self.__storage.drop_instance(cls, key)
+
+    def get_instance(self, cls, key):
+        return self.__storage.get_instance(cls, key)
+
+    def set_instance(self, cls, key, instance):
+        return self.__storage.set_instance(cls, key, instance)
+
+    def flush_instances(self):
+        return self.__storage.flush()
+
+    def get(self, path, params=None):
+        return self.__transport.get(path, params, self.__credentials)
+
+    def get_stream(self, path, root, params=None):
+        return self.__transport.get_stream(path, root, params,
+                                           self.__credentials)
+
+    def post(self, path, values):
+        return self.__transport.post(path, values, self.__credentials)
+
+    def put(self, path, values):
+        return self.__transport.put(path, values, self.__credentials)
+
+    def delete(self, path):
+        return self.__transport.delete(path, self.__credentials)
+
+
+class _AsyncRawV1(object):
+    """Non-blocking twin of _RawV1, returning AsyncResults"""
+
+    __metaclass__ = _Singleton
+
+    DEFAULT_MAX_CONCURRENCY = _RawV1.DEFAULT_POOL_MAXSIZE
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.__pool = PerProcess(lambda: ThreadPool(self.__max_concurrency))
+
+        self.configure(max_concurrency)
+
+    def configure(self, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """Run calls on max_concurrency workers, letting queued ones finish"""
+        self.__max_concurrency = max_concurrency
+
+        pool = self.__pool.discard()
+        if pool is not None:
+            pool.close()
+
+    def get_max_concurrency(self):
+        return self.__max_concurrency
+
+    def submit(self, func, args=(), kwargs=None, callback=None):
+        return self.__pool.get().apply_async(_bind_context(func), args,
+                                            kwargs or {}, callback)
+
+    def close(self):
+        pool = self.__pool.discard()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def get(self, path, params=None, callback=None):
+        client = get_active_client()
+        return self.submit(client.get, (path, params), callback=callback)
+
+    def post(self, path, values, callback=None):
+        client = get_active_client()
+        return self.submit(client.post, (path, values), callback=callback)
+
+    def put(self, path, values, callback=None):
+        client = get_active_client()
+        return self.submit(client.put, (path, values), callback=callback)
+
+    def delete(self, path, callback=None):
+        client = get_active_client()
+        return self.submit(client.delete, (path,), callback=callback)
+
+
 def register_custom_cenit(host=None, port=None, path=None, ssl=True,
-                          verify=True):
-    _RawV1(host, port, path, ssl, verify)
+                          verify=True,
+                          pool_connections=_RawV1.DEFAULT_POOL_CONNECTIONS,
+                          pool_maxsize=_RawV1.DEFAULT_POOL_MAXSIZE,
+                          keep_alive=True,
+                          connect_timeout=_RawV1.DEFAULT_CONNECT_TIMEOUT,
+                          read_timeout=_RawV1.DEFAULT_READ_TIMEOUT,
+                          endpoints=None, strategy=ROUND_ROBIN):
+    # The client is a singleton, so configure it whether or not it exists.
+    _RawV1().configure(host, port, path, ssl, verify,
+                       pool_connections=pool_connections,
+                       pool_maxsize=pool_maxsize, keep_alive=keep_alive,
+                       connect_timeout=connect_timeout,
+                       read_timeout=read_timeout, endpoints=endpoints,
+                       strategy=strategy)
 
 
 def get_cenit_client():
     return _RawV1()
 
 
+_tenants = {}
+_tenants_lock = threading.Lock()
+
+
+@contextmanager
+def _deadline_at(deadline):
+    saved = _context.deadline
+    if deadline is not None and (saved is None or deadline < saved):
+        _context.deadline = deadline
+    try:
+        yield
+    finally:
+        _context.deadline = saved
+
+
+def request_deadline(seconds):
+    """Give the requests made in this block seconds to complete in total"""
+    return _deadline_at(time.time() + seconds)
+
+
+def _deadline_budget(func):
+    """Let func take a deadline=seconds budget shared by all its requests"""
+    @functools.wraps(func)
+    def _wrapper(*args, **kwargs):
+        deadline = kwargs.pop('deadline', None)
+        if deadline is None:
+            return func(*args, **kwargs)
+        with request_deadline(deadline):
+            return func(*args, **kwargs)
+
+    return _wrapper
+
+
+@contextmanager
+def request_priority(priority):
+    """Schedule the requests made in this block in the given lane"""
+    saved = _context.priority
+    _context.priority = priority
+    try:
+        yield
+    finally:
+        _context.priority = saved
+
+
+@contextmanager
+def request_trace(trace_id=None, parent_id=None):
+    """Trace the requests made in this block as spans of one trace"""
+    saved = _context.trace
+    _context.trace = (trace_id or binascii.hexlify(os.urandom(16)),
+                      parent_id)
+    try:
+        yield _context.trace[0]
+    finally:
+        _context.trace = saved
+
+
+def get_tenant_client(key, token):
+    """Client of the tenant owning key/token, created on first use"""
+    with _tenants_lock:
+        if (key, token) not in _tenants:
+            _tenants[(key, token)] = _TenantClient(key, token)
+        return _tenants[(key, token)]
+
+
+def get_active_client():
+    """Innermost tenant client entered in this thread, or the global one"""
+    if _context.clients:
+        return _context.clients[-1]
+    if not CenitModel.api_client:
+        CenitModel.api_client = get_cenit_client()
+    return CenitModel.api_client
+
+
+def register_async_cenit(
+        max_concurrency=_AsyncRawV1.DEFAULT_MAX_CONCURRENCY):
+    _AsyncRawV1().configure(max_concurrency)
+
+
+def get_async_cenit_client():
+    return _AsyncRawV1()
+
+
 def use_credentials(key, token):
     client = get_cenit_client()
     client.set_credentials(key, token)
 
 
+@_deadline_budget
+def push_all(objects, batch_size=_RawV1.PUSH_BATCH_SIZE):
+    """Push models of any type, root by root, through the bulk push hook"""
+    client = get_active_client()
+
+    groups = OrderedDict()
+    for obj in objects:
+        groups.setdefault(obj.root, []).append(obj)
+
+    with request_priority(BULK):
+        rc = _push_groups(client, groups, batch_size)
+
+    client.flush_instances()
+    return rc
+
+
+def _push_groups(client, groups, batch_size):
+    rc = True
+    for root, group in groups.items():
+        classes = set(obj.__class__ for obj in group)
+
+        for i in range(0, len(group), batch_size):
+            batch = group[i:i + batch_size]
+            payloads = [obj.to_dict() for obj in batch]
+
+            try:
+                response = client.post(_RawV1.PUSH_HOOK, {root: payloads})
+            finally:
+                # Even a failed batch may have been partly applied.
+                for cls in classes:
+                    cls._invalidate_queries()
+            records = response.get('success', {}).get(root, [])
+            if isinstance(records, dict):
+                records = [records]
+
+            rc = _assign_pushed_ids(batch, payloads, records) and rc
+            rc = rc and not response.get('errors')
+
+    return rc
+
+
+def _repeats(entries, previous):
+    """Whether a page starts like the one before, as when paging is ignored"""
+    if not entries or not previous:
+        return False
+    first = entries[0].get('id')
+    return first is not None and first == previous[0].get('id')
+
+
+def _assign_pushed_ids(objects, payloads, records):
+    if len(records) == len(objects):
+        for obj, record in zip(objects, records):
+            obj.id = record['id']
+        return True
+
+    # Part of the batch was rejected, so the records no longer line up with
+    # what was sent; pair them by the identifying values sent instead. Only
+    # a pairing that cannot be mistaken is trusted.
+    def _identity(payload):
+        return tuple((k, payload[k]) for k in CenitModel.PUSH_KEYS
+                     if k in payload)
+
+    identities = [_identity(p) for p in payloads]
+
+    rc = True
+    for obj, identity in zip(objects, identities):
+        matches = [r for r in records
+                   if all(r.get(k) == v for k, v in identity)]
+        if identity and len(matches) == 1 and \
+                identities.count(identity) == 1:
+            obj.id = matches[0]['id']
+        else:
+            rc = False
+    return rc
+
+
+MAX_INTERNED = 100000
+
+_strings = {}
+_slot_names = {}
+_layouts = {}
+
+
+def intern_string(value):
+    """An earlier string equal to value, so repeats share one object"""
+    if not isinstance(value, basestring):
+        return value
+    rc = _strings.get(value)
+    if rc is None:
+        if len(_strings) >= MAX_INTERNED:
+            return value
+        rc = _strings.setdefault(value, value)
+    # u'a' == 'a', but the caller's type is kept.
+    return rc if type(rc) is type(value) else value
+
+
 class CenitModel(object):
 
+    # Subclasses declare __slots__ too, so no instance has a __dict__.
+    __slots__ = ('__weakref__', '__id', 'name', 'namespace')
+
     api_client = None
 
     root = None
     properties = []
 
+    PUSH_KEYS = ('namespace', 'name', 'key', 'slug', 'uri')
+
     def __init__(self, name, id_=None, namespace=None):
         self.__id = None
         self.id = id_
 
         self.name = name
-        self.namespace = namespace
+        self.namespace = intern_string(namespace)
 
     @property
     def id(self):
@@ -273,20 +1023,19 @@ class CenitModel(object):
 
     @id.setter
     def id(self, id_):
-        if not CenitModel.api_client:
-            CenitModel.api_client = get_cenit_client()
-        client = CenitModel.api_client
+        client = get_active_client()
 
         self.__id = id_
         if id_:
             client.set_instance(self.__class__, id_, self)
             # self.__class__._instances[id_] = self
 
-    def to_dict(self, referenced=False):
+    def to_dict(self, referenced=False, expand=False):
+        """Serializable state, with nested models in full if expand is set"""
         def _serialize(value):
             if isinstance(value, CenitModel):
-                ref = value.id not in (None, False)
-                rc_ = value.to_dict(ref)
+                ref = value.id not in (None, False) and not expand
+                rc_ = value.to_dict(ref, expand)
             elif isinstance(value, list):
                 rc_ = []
                 for v in value:
@@ -295,8 +1044,6 @@ class CenitModel(object):
                 rc_ = value
             return rc_
 
-        data = vars(self)
-
         rc = {}
         if referenced:
             rc.update({
@@ -305,67 +1052,246 @@ class CenitModel(object):
             })
             return rc
 
-        for attr in data:
-            if not data[attr]:
-                continue
-
+        data = [(prop, getattr(self, attr, None))
+                for prop, attr in self._layout()]
+        # Subclasses that declare no __slots__ keep theirs in a __dict__.
+        for attr, value in getattr(self, '__dict__', {}).items():
             prop = attr.rpartition("__")[-1]
-            if prop not in self.properties:
+            if prop in self.properties:
+                data.append((prop, value))
+
+        for prop, value in data:
+            if not value:
                 continue
 
-            rc[prop] = _serialize(data[attr])
+            rc[prop] = _serialize(value)
         return rc
 
+    @classmethod
+    def _slots(cls):
+        """Every instance attribute, as stored"""
+        slots = _slot_names.get(cls)
+        if slots is None:
+            slots = []
+            for klass in cls.__mro__:
+                for slot in klass.__dict__.get('__slots__', ()):
+                    if slot == '__weakref__':
+                        continue
+                    if slot.startswith("__") and not slot.endswith("__"):
+                        slot = "_%s%s" % (klass.__name__.lstrip("_"), slot)
+                    slots.append(slot)
+            _slot_names[cls] = slots
+        return slots
+
+    @classmethod
+    def _layout(cls):
+        """(property, slot attribute) pairs to_dict serializes"""
+        layout = _layouts.get(cls)
+        if layout is None:
+            layout = [(attr.rpartition("__")[-1], attr)
+                      for attr in cls._slots()
+                      if attr.rpartition("__")[-1] in cls.properties]
+            _layouts[cls] = layout
+        return layout
+
+    # Slots are not pickled by default, so pickle needs to be told them.
+    # As with a plain object, unpickling does not touch the identity map.
+    def __getstate__(self):
+        state = dict(getattr(self, '__dict__', {}))
+        state.update((attr, getattr(self, attr)) for attr in self._slots()
+                     if hasattr(self, attr))
+        return state
+
+    def __setstate__(self, state):
+        for attr, value in state.items():
+            setattr(self, attr, value)
+
+    @_deadline_budget
     def push(self):
         payload = self.to_dict()
 
-        if not CenitModel.api_client:
-            CenitModel.api_client = get_cenit_client()
-        client = CenitModel.api_client
+        client = get_active_client()
 
         hook = "setup/{}".format(self.root)
         rc = client.post(hook, payload)
-        print "[PUSH] RC:", rc
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug("PUSH %s: %s", hook, logs.payload(rc))
+        self._invalidate_queries()
 
         if rc.get('success', False):
             self.id = rc['success'][self.root]['id']
+            client.flush_instances()
         else:
             return False
 
         return True
 
+    @classmethod
+    @_deadline_budget
+    def push_many(cls, objects, batch_size=_RawV1.PUSH_BATCH_SIZE):
+        assert all(isinstance(x, cls) for x in objects), \
+            "All objects must be instance of %s" % (cls,)
+        return push_all(objects, batch_size=batch_size)
+
+    def push_async(self, callback=None):
+        return get_async_cenit_client().submit(self.push, callback=callback)
+
+    @_deadline_budget
     def drop(self):
-        if not CenitModel.api_client:
-            CenitModel.api_client = get_cenit_client()
-        client = CenitModel.api_client
+        client = get_active_client()
 
         hook = "setup/{}/{}".format(self.root, self.id)
         rc = client.delete(hook)
-        print "[DROP] RC:", rc
+        _logger.debug("DROP %s: %s", hook, rc)
+        self._invalidate_queries()
         if rc:
             self._del()
             client.drop_instance(self.__class__, self.id)
 
         return rc
 
+    def drop_async(self, callback=None):
+        return get_async_cenit_client().submit(self.drop, callback=callback)
+
+    @classmethod
+    @_deadline_budget
+    def fetch(cls, cache=True, stream=False, **filters):
+        """Objects matching filters, hydrated as they are parsed with stream"""
+        client = get_active_client()
+
+        queries = client.get_query_cache() if cache else None
+        if queries is not None:
+            key = queries.key(cls.__module__, cls.__name__, filters,
+                              client.get_credentials())
+            objects = queries.get(key)
+            if objects is not None:
+                return objects
+            generation = queries.generation(cls._roots())
+
+        hook = "setup/{}".format(cls.root)
+        if stream:
+            objects = []
+            for entry in client.get_stream(hook, cls.root, filters):
+                objects.extend(cls.from_values([entry]))
+        else:
+            rc = client.get(hook, filters)
+
+            if _logger.isEnabledFor(logging.DEBUG):
+                _logger.debug("FETCH %s: %s", hook, logs.payload(rc))
+            objects = cls.from_values(rc[cls.root])
+        client.flush_instances()
+
+        if queries is not None:
+            queries.set(key, cls._roots(), objects, generation)
+        return objects
+
+    @classmethod
+    def iter_fetch(cls, page_size=_RawV1.PAGE_SIZE, prefetch=2, deadline=None,
+                   **filters):
+        """Yield the objects matching filters, fetching prefetch pages ahead"""
+        client = get_active_client()
+        async_client = get_async_cenit_client()
+
+        if deadline is not None:
+            deadline += time.time()
+
+        hook = "setup/{}".format(cls.root)
+
+        def _request(page):
+            params = dict(filters)
+            params.update({
+                _RawV1.PAGE_PARAM: page,
+                _RawV1.LIMIT_PARAM: page_size,
+            })
+            with request_priority(BULK), _deadline_at(deadline):
+                return async_client.submit(client.get, (hook, params))
+
+        # The first page, and the prefetch that follow it.
+        pending = deque(_request(page) for page in range(1, prefetch + 2))
+        next_page = prefetch + 2
+
+        previous = None
+        while pending:
+            entries = pending.popleft().get().get(cls.root, [])
+            if _repeats(entries, previous):
+                break
+            previous = entries
+
+            # A short page is the last one; an oversized one means the server
+            # ignored the paging parameters and returned everything at once.
+            last = len(entries) != page_size
+            if last:
+                pending.clear()
+
+            objects = cls.from_values(entries)
+            client.flush_instances()
+
+            for obj in objects:
+                yield obj
+
+            if not last:
+                pending.append(_request(next_page))
+                next_page += 1
+
     @classmethod
-    def fetch(cls, **filters):
-        if not CenitModel.api_client:
-            CenitModel.api_client = get_cenit_client()
-        client = CenitModel.api_client
+    @_deadline_budget
+    def fetch_parallel(cls, workers=4, page_size=_RawV1.PAGE_SIZE, **filters):
+        """Fetch every object matching filters with workers paging at once"""
+        client = get_active_client()
 
         hook = "setup/{}".format(cls.root)
-        rc = client.get(hook, filters)
 
-        print "[FETCH] RC:", rc
-        objects = cls.from_values(rc[cls.root])
+        # Worker i walks pages i, i + workers, ... until a short page, so
+        # none waits to learn the collection size.
+        def _walk(first):
+            pages = {}
+            previous = None
+            for page in itertools.count(first, workers):
+                params = dict(filters)
+                params.update({
+                    _RawV1.PAGE_PARAM: page,
+                    _RawV1.LIMIT_PARAM: page_size,
+                })
+                entries = client.get(hook, params).get(cls.root, [])
+                if _repeats(entries, previous):
+                    return pages
+                pages[page] = previous = entries
+                if len(entries) != page_size:
+                    return pages
+
+        pool = ThreadPool(workers)
+        try:
+            with request_priority(BULK):
+                stripes = pool.map(_bind_context(_walk),
+                                   range(1, workers + 1))
+        finally:
+            pool.close()
+
+        pages = {}
+        for stripe in stripes:
+            pages.update(stripe)
+
+        objects = []
+        previous = None
+        for page in sorted(pages):
+            if _repeats(pages[page], previous):
+                break
+            previous = pages[page]
+            objects.extend(cls.from_values(pages[page]))
+            if len(pages[page]) != page_size:
+                break
+
+        client.flush_instances()
         return objects
 
+    @classmethod
+    def fetch_async(cls, callback=None, **filters):
+        return get_async_cenit_client().submit(cls.fetch, kwargs=filters,
+                                               callback=callback)
+
     @classmethod
     def get_instance(cls, id_):
-        if not CenitModel.api_client:
-            CenitModel.api_client = get_cenit_client()
-        client = CenitModel.api_client
+        client = get_active_client()
 
         return client.get_instance(cls, id_)
         # return cls._instances.get(id_, None)
@@ -374,6 +1300,17 @@ class CenitModel(object):
     def from_values(cls, values):
         raise NotImplementedError
 
+    @classmethod
+    def _roots(cls):
+        return set(k.root for k in cls.__mro__ if getattr(k, 'root', None))
+
+    @classmethod
+    def _invalidate_queries(cls):
+        queries = get_active_client().get_query_cache()
+
+        if queries is not None:
+            queries.invalidate(cls._roots())
+
     @staticmethod
     def _sluggify(name):
         return name.lower().replace(" ", "_")
@@ -0,0 +1,293 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  cache.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import simplejson
+
+from exceptions import RequestTimeoutError
+
+
+def cache_key(*parts):
+    return simplejson.dumps(parts, sort_keys=True)
+
+
+class _Entry(object):
+
+    def __init__(self, value):
+        self.value = value
+        self.stored_at = time.time()
+
+    def age(self):
+        return time.time() - self.stored_at
+
+
+class LRUCache(object):
+    """Size bounded, least recently used cache with a freshness TTL"""
+
+    DEFAULT_MAX_ENTRIES = 1024
+    DEFAULT_TTL = 0
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        assert max_entries > 0, "'max_entries' must be positive"
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    key = staticmethod(cache_key)
+
+    def is_fresh(self, entry):
+        return entry.age() < self.ttl
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+            return entry
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._put(key, entry)
+        return entry
+
+    def _put(self, key, entry):
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return entry and entry.value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+        }
+
+
+class _Response(_Entry):
+
+    def __init__(self, value, etag=None, last_modified=None):
+        super(_Response, self).__init__(value)
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ResponseCache(LRUCache):
+    """Shared parsed GET responses, revalidated with ETag / Last-Modified"""
+
+    def __init__(self, max_entries=LRUCache.DEFAULT_MAX_ENTRIES,
+                 ttl=LRUCache.DEFAULT_TTL):
+        super(ResponseCache, self).__init__(max_entries, ttl)
+        self.revalidations = 0
+
+    def lookup(self, key):
+        entry = self._lookup(key)
+        if entry is not None and self.is_fresh(entry):
+            with self._lock:
+                self.hits += 1
+        return entry
+
+    def revalidate(self, key, entry):
+        with self._lock:
+            self.revalidations += 1
+            self.hits += 1
+        return self._store(key, _Response(entry.value, entry.etag,
+                                          entry.last_modified)).value
+
+    def store(self, key, value, headers):
+        with self._lock:
+            self.misses += 1
+
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        if etag or last_modified or self.ttl > 0:
+            self._store(key, _Response(value, etag, last_modified))
+        else:
+            self.pop(key)
+        return value
+
+    def stats(self):
+        rc = super(ResponseCache, self).stats()
+        rc['revalidations'] = self.revalidations
+        return rc
+
+
+class _Query(_Entry):
+
+    def __init__(self, value, roots):
+        super(_Query, self).__init__(value)
+        self.roots = frozenset(roots)
+
+
+class QueryCache(LRUCache):
+    """Hydrated fetch results, invalidated by a push or drop on their roots"""
+
+    DEFAULT_TTL = 60
+
+    def __init__(self, max_entries=LRUCache.DEFAULT_MAX_ENTRIES,
+                 ttl=DEFAULT_TTL):
+        super(QueryCache, self).__init__(max_entries, ttl)
+        self.invalidations = 0
+        self.discarded = 0
+
+        self.__generations = {}
+
+    def __generation(self, roots):
+        return tuple(self.__generations.get(r, 0) for r in sorted(roots))
+
+    def generation(self, roots):
+        """Token to hand set() for a fetch of roots starting now"""
+        with self._lock:
+            return self.__generation(roots)
+
+    def get(self, key):
+        entry = self._lookup(key)
+        with self._lock:
+            if entry is not None and self.is_fresh(entry):
+                self.hits += 1
+                return entry.value[:]
+            self.misses += 1
+        return None
+
+    def set(self, key, roots, objects, generation=None):
+        with self._lock:
+            if generation is not None and \
+                    generation != self.__generation(roots):
+                self.discarded += 1
+            else:
+                self._put(key, _Query(objects[:], roots))
+        return objects
+
+    def invalidate(self, roots):
+        roots = frozenset(roots)
+        with self._lock:
+            for root in roots:
+                self.__generations[root] = self.__generations.get(root, 0) + 1
+            stale = [k for k, entry in self._entries.items()
+                     if entry.roots & roots]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def stats(self):
+        rc = super(QueryCache, self).stats()
+        rc['invalidations'] = self.invalidations
+        rc['discarded'] = self.discarded
+        return rc
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Run concurrent calls sharing a key only once"""
+
+    key = staticmethod(cache_key)
+
+    def __init__(self):
+        self.__flights = {}
+        self.__lock = threading.Lock()
+
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, func, args=(), timeout=None):
+        with self.__lock:
+            flight = self.__flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.__flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not flight.done.wait(timeout):
+                raise RequestTimeoutError()
+            if flight.error is not None:
+                raise flight.error[0], flight.error[1], flight.error[2]
+            return flight.value
+
+        try:
+            flight.value = func(*args)
+            return flight.value
+        except Exception:
+            flight.error = sys.exc_info()
+            raise
+        finally:
+            with self.__lock:
+                del self.__flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self.__lock:
+            calls = self.leaders + self.coalesced
+            return {
+                'in_flight': len(self.__flights),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'coalesce_rate':
+                    float(self.coalesced) / calls if calls else 0.0,
+            }
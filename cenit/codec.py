@@ -0,0 +1,169 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  codec.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+import codecs
+import re
+
+import simplejson
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class Codec(object):
+    """Encodes request bodies and decodes response bodies"""
+
+    name = None
+
+    def dumps(self, obj):
+        raise NotImplementedError()
+
+    def loads(self, data):
+        """Decode data, the raw UTF-8 bytes of a response body"""
+        raise NotImplementedError()
+
+
+class SimpleJsonCodec(Codec):
+
+    name = "simplejson"
+
+    def dumps(self, obj):
+        return simplejson.dumps(obj)
+
+    def loads(self, data):
+        # Decoding first keeps every string unicode, as r.json() did.
+        return simplejson.loads(data.decode('utf-8'))
+
+
+class UltraJsonCodec(SimpleJsonCodec):
+    """ujson based decoding, exact to what simplejson gives"""
+
+    name = "ujson"
+
+    def __init__(self):
+        assert ujson is not None, "ujson is not installed"
+
+    def loads(self, data):
+        try:
+            return ujson.loads(data, precise_float=True)
+        except (ValueError, OverflowError):
+            return super(UltraJsonCodec, self).loads(data)
+
+
+def default_codec():
+    """The fastest codec installed"""
+    if ujson is not None:
+        return UltraJsonCodec()
+    return SimpleJsonCodec()
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class _StreamParser(object):
+    """Pulls JSON values off a body that arrives in chunks"""
+
+    def __init__(self, chunks):
+        self.__chunks = iter(chunks)
+        self.__decode = codecs.getincrementaldecoder('utf-8')().decode
+        self.__scan = simplejson.JSONDecoder().raw_decode
+
+        self.__buffer = u''
+        self.__pos = 0
+        self.__eof = False
+
+    def __fill(self):
+        if self.__eof:
+            return False
+        try:
+            chunk = next(self.__chunks)
+        except StopIteration:
+            chunk = b''
+            self.__eof = True
+        self.__buffer = self.__buffer[self.__pos:] + \
+            self.__decode(chunk, self.__eof)
+        self.__pos = 0
+        return True
+
+    def __peek(self):
+        while True:
+            self.__pos = _WHITESPACE.match(self.__buffer, self.__pos).end()
+            if self.__pos < len(self.__buffer):
+                return self.__buffer[self.__pos]
+            if not self.__fill():
+                return None
+
+    def __expect(self, chars):
+        char = self.__peek()
+        if char is None or char not in chars:
+            raise simplejson.JSONDecodeError(
+                "Expecting one of %r" % (chars,), self.__buffer, self.__pos)
+        self.__pos += 1
+        return char
+
+    def __value(self):
+        self.__peek()
+        while True:
+            try:
+                value, end = self.__scan(self.__buffer, self.__pos)
+            except simplejson.JSONDecodeError:
+                if not self.__fill():
+                    raise
+                continue
+            # A number at the very end may still be missing some digits, and
+            # one cut after its point or exponent mark was scanned short.
+            cut = end == len(self.__buffer) or (
+                isinstance(value, (int, long, float)) and
+                self.__buffer[end] in '.eE')
+            if not cut or not self.__fill():
+                self.__pos = end
+                return value
+
+    def iter_member(self, key):
+        self.__expect('{')
+        if self.__peek() == '}':
+            return
+        while True:
+            name = self.__value()
+            self.__expect(':')
+            if name == key and self.__peek() == '[':
+                self.__pos += 1
+                if self.__peek() == ']':
+                    self.__pos += 1
+                else:
+                    while True:
+                        yield self.__value()
+                        if self.__expect(',]') == ']':
+                            break
+            else:
+                self.__value()
+            if self.__expect(',}') == '}':
+                return
+
+
+def iter_array(chunks, key):
+    """Yield the items of the array under key as chunks of the body arrive"""
+    return _StreamParser(chunks).iter_member(key)
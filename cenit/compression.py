@@ -0,0 +1,79 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  compression.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+import threading
+import zlib
+
+
+class Compression(object):
+    """gzip request bodies of at least threshold bytes"""
+
+    DEFAULT_THRESHOLD = 1024
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, level=6):
+        self.threshold = threshold
+        self.level = level
+
+    def compress(self, payload):
+        """Return the body to send and its Content-Encoding, if any"""
+        if len(payload) < self.threshold:
+            return payload, None
+        gzip = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return gzip.compress(payload) + gzip.flush(), "gzip"
+
+
+class TrafficCounter(object):
+    """Body bytes on the wire against the bytes they encode"""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.__lock:
+            self.sent_wire = 0
+            self.sent_logical = 0
+            self.received_wire = 0
+            self.received_logical = 0
+
+    def sent(self, wire, logical):
+        with self.__lock:
+            self.sent_wire += wire
+            self.sent_logical += logical
+
+    def received(self, wire, logical):
+        with self.__lock:
+            self.received_wire += wire
+            self.received_logical += logical
+
+    def stats(self):
+        with self.__lock:
+            return {
+                'sent_wire': self.sent_wire,
+                'sent_logical': self.sent_logical,
+                'received_wire': self.received_wire,
+                'received_logical': self.received_logical,
+                'saved': (self.sent_logical - self.sent_wire +
+                          self.received_logical - self.received_wire),
+            }
@@ -0,0 +1,160 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  endpoints.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+import itertools
+import threading
+import time
+
+
+ROUND_ROBIN = "round_robin"
+LEAST_OUTSTANDING = "least_outstanding"
+
+
+class Endpoint(object):
+    """One Cenit replica"""
+
+    def __init__(self, host, port=None, path="api/v1", scheme="https"):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.scheme = scheme
+
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0
+
+    @property
+    def netloc(self):
+        return self.host if not self.port else "%s:%s" % (self.host,
+                                                          self.port)
+
+    def url(self, hook):
+        return "{scheme}://{netloc}/{path}/{hook}".format(
+            scheme=self.scheme,
+            netloc=self.netloc,
+            path=self.path,
+            hook=hook,
+        )
+
+    def __repr__(self):
+        return "<Endpoint %s>" % (self.netloc,)
+
+
+def parse_endpoint(spec, path="api/v1", scheme="https"):
+    """Build an Endpoint from "host", "host:port" or a (host, port) pair"""
+    if isinstance(spec, Endpoint):
+        return spec
+    if isinstance(spec, basestring):
+        host, _, port = spec.partition(":")
+        return Endpoint(host, int(port) if port else None, path, scheme)
+    host, port = spec
+    return Endpoint(host, port, path, scheme)
+
+
+class EndpointPool(object):
+    """Spread requests over several replicas, ejecting failing ones"""
+
+    def __init__(self, endpoints, strategy=ROUND_ROBIN, max_failures=3,
+                 eject_for=30):
+        assert endpoints, "At least one endpoint is required"
+        assert strategy in (ROUND_ROBIN, LEAST_OUTSTANDING), \
+            "Unknown strategy %s" % (strategy,)
+
+        self.endpoints = list(endpoints)
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.eject_for = eject_for
+
+        self.failovers = 0
+
+        self.__turn = itertools.count()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def checkout(self, exclude=()):
+        """Pick an endpoint not in exclude and count a request against it"""
+        with self.__lock:
+            now = time.time()
+            candidates = [e for e in self.endpoints if e not in exclude]
+            healthy = [e for e in candidates if e.ejected_until <= now]
+
+            if not healthy:
+                endpoint = min(candidates or self.endpoints,
+                               key=lambda e: e.ejected_until)
+            elif self.strategy == LEAST_OUTSTANDING:
+                # Ties go round robin so idle endpoints all get a share.
+                turn = next(self.__turn)
+                endpoint = min(
+                    healthy,
+                    key=lambda e: (e.outstanding,
+                                   (self.endpoints.index(e) - turn) %
+                                   len(self.endpoints))
+                )
+            else:
+                endpoint = healthy[next(self.__turn) % len(healthy)]
+
+            if endpoint.failures >= self.max_failures:
+                # A trial request; keep others off it until it reports back.
+                endpoint.ejected_until = now + self.eject_for
+
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            if exclude:
+                self.failovers += 1
+            return endpoint
+
+    def checkin(self, endpoint, healthy):
+        """Report a request done; healthy None leaves its record untouched"""
+        with self.__lock:
+            endpoint.outstanding -= 1
+            if healthy is None:
+                return
+            if healthy:
+                endpoint.failures = 0
+                endpoint.ejected_until = 0
+                return
+
+            endpoint.failures += 1
+            if endpoint.failures >= self.max_failures:
+                if endpoint.ejected_until <= time.time():
+                    endpoint.ejections += 1
+                endpoint.ejected_until = time.time() + self.eject_for
+
+    def stats(self):
+        with self.__lock:
+            now = time.time()
+            return {
+                'failovers': self.failovers,
+                'endpoints': dict((e.netloc, {
+                    'requests': e.requests,
+                    'outstanding': e.outstanding,
+                    'failures': e.failures,
+                    'ejections': e.ejections,
+                    'ejected': e.ejected_until > now,
+                }) for e in self.endpoints),
+            }
@@ -39,3 +39,9 @@ class UnauthorizedError (Exception):
     def __init__(self):
         super(UnauthorizedError, self).__init__(
             "Credentials required or invalid.")
+
+
+class RequestTimeoutError (AccessError):
+    def __init__(self):
+        super(AccessError, self).__init__(
+            "Cenit did not answer in time.")
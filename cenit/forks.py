@@ -0,0 +1,55 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  forks.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+import os
+import threading
+
+
+class PerProcess(object):
+    """A value made by factory, and made again after an os.fork()"""
+
+    def __init__(self, factory):
+        self.factory = factory
+
+        # Value and pid are swapped as a single tuple so get() never pairs
+        # the value of one process with the pid of another.
+        self.__state = (None, None)
+        self.__lock = threading.Lock()
+
+    def get(self):
+        value, pid = self.__state
+        if pid != os.getpid():
+            with self.__lock:
+                value, pid = self.__state
+                if pid != os.getpid():
+                    value = self.factory()
+                    self.__state = (value, os.getpid())
+        return value
+
+    def discard(self):
+        """Forget the value, returning it if this process made it"""
+        with self.__lock:
+            value, pid = self.__state
+            self.__state = (None, None)
+        return value if pid == os.getpid() else None
@@ -0,0 +1,299 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  hedging.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+import heapq
+import itertools
+import sys
+import threading
+import time
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from forks import PerProcess
+
+
+class LatencyTracker(object):
+    """Latencies of the most recent window calls, sorted every refresh"""
+
+    def __init__(self, window=1000, refresh=50):
+        self.refresh = refresh
+
+        self.__samples = deque(maxlen=window)
+        self.__sorted = []
+        self.__recorded = 0
+        self.__lock = threading.Lock()
+
+    def record(self, latency):
+        with self.__lock:
+            self.__samples.append(latency)
+            self.__recorded += 1
+
+    def __len__(self):
+        return len(self.__samples)
+
+    def percentile(self, p):
+        with self.__lock:
+            if self.__recorded >= min(self.refresh, len(self.__samples)) \
+                    and self.__recorded:
+                self.__sorted = sorted(self.__samples)
+                self.__recorded = 0
+            samples = self.__sorted
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+class _Race(object):
+    """The attempts of one hedged call; the first to succeed wins"""
+
+    def __init__(self, func, args, latencies):
+        self.func = func
+        self.args = args
+        self.latencies = latencies
+
+        # signals[i] is released once the i-th result is in.
+        self.results = []
+        self.signals = [threading.Lock(), threading.Lock()]
+        for signal in self.signals:
+            signal.acquire()
+
+        self.hedged = False
+        self.decided = False
+        self.lock = threading.Lock()
+
+    def attempt(self, n):
+        if self.decided:
+            return
+        start = time.time()
+        try:
+            value = self.func(*self.args)
+        except Exception:
+            rc = (n, False, sys.exc_info())
+        else:
+            self.latencies.record(time.time() - start)
+            rc = (n, True, value)
+
+        with self.lock:
+            if not self.decided:
+                self.results.append(rc)
+                self.signals[len(self.results) - 1].release()
+                return
+        _close(rc)
+
+    def result(self, i):
+        self.signals[i].acquire()
+        return self.results[i]
+
+    def decide(self, taken):
+        """Stop taking results, closing those after the first taken"""
+        with self.lock:
+            self.decided = True
+            for rc in self.results[taken:]:
+                _close(rc)
+
+class _Timer(object):
+    """Calls functions at given times, all from one thread"""
+
+    def __init__(self):
+        self.__heap = []
+        self.__order = itertools.count()
+        self.__condition = threading.Condition()
+        self.__thread = PerProcess(self.__start)
+
+    def __start(self):
+        thread = threading.Thread(target=self.__run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def schedule(self, due, func, *args):
+        self.__thread.get()
+        with self.__condition:
+            entry = (due, next(self.__order), func, args)
+            heapq.heappush(self.__heap, entry)
+            # Waking the thread is only needed if it now has less to wait.
+            if self.__heap[0] is entry:
+                self.__condition.notify()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                while not self.__heap:
+                    self.__condition.wait()
+                left = self.__heap[0][0] - time.time()
+                if left > 0:
+                    self.__condition.wait(left)
+                    continue
+                due, _, func, args = heapq.heappop(self.__heap)
+            func(*args)
+
+
+class _Workers(object):
+    """Threads started as calls need them and kept for later calls"""
+
+    def __init__(self):
+        self.__idle = PerProcess(list)
+        self.__lock = threading.Lock()
+
+    def run(self, func, *args):
+        idle = self.__idle.get()
+        with self.__lock:
+            worker = idle.pop() if idle else None
+        if worker is None:
+            worker = [threading.Lock(), None]
+            worker[0].acquire()
+            thread = threading.Thread(target=self.__work, args=(worker,))
+            thread.daemon = True
+            thread.start()
+        worker[1] = (func, args)
+        worker[0].release()
+
+    def __work(self, worker):
+        wake = worker[0]
+        while True:
+            wake.acquire()
+            func, args = worker[1]
+            worker[1] = None
+            func(*args)
+            with self.__lock:
+                self.__idle.get().append(worker)
+
+
+def _close(result):
+    n, ok, value = result
+    if ok and hasattr(value, 'close'):
+        value.close()
+
+
+class Hedger(object):
+    """Back a slow idempotent call up with an identical second one"""
+
+    DEFAULT_MAX_WORKERS = 20
+
+    def __init__(self, percentile=0.95, min_delay=0.005, min_samples=20,
+                 window=1000, max_workers=DEFAULT_MAX_WORKERS, budget=0.05):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self.budget = budget
+
+        self.latencies = LatencyTracker(window)
+
+        self.__pool = PerProcess(lambda: ThreadPool(self.max_workers))
+        self.__timer = _Timer()
+        self.__primaries = _Workers()
+        self.__lock = threading.Lock()
+
+        self.__tokens = 0.0
+        self.__inflight = 0
+
+        self.requests = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def delay(self):
+        if len(self.latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, self.latencies.percentile(self.percentile))
+
+    def __may_hedge(self):
+        return self.__tokens >= 1 and self.__inflight < self.max_workers
+
+    def __take_hedge(self):
+        with self.__lock:
+            if not self.__may_hedge():
+                return False
+            self.__tokens -= 1
+            self.__inflight += 1
+            self.hedges_sent += 1
+            return True
+
+    def __send_hedge(self, race):
+        with race.lock:
+            if race.decided or not self.__take_hedge():
+                return
+            race.hedged = True
+        self.__pool.get().apply_async(self.__hedge, (race,))
+
+    def __hedge(self, race):
+        try:
+            race.attempt(1)
+        finally:
+            with self.__lock:
+                self.__inflight -= 1
+
+    def run(self, func, args=()):
+        with self.__lock:
+            self.requests += 1
+            # Capped so a quiet spell cannot save up a burst of hedges.
+            self.__tokens = min(self.__tokens + self.budget, self.max_workers)
+            hedgeable = self.__may_hedge()
+
+        delay = self.delay()
+        if delay is None or not hedgeable:
+            start = time.time()
+            rc = func(*args)
+            self.latencies.record(time.time() - start)
+            return rc
+
+        race = _Race(func, args, self.latencies)
+        self.__primaries.run(race.attempt, 0)
+        self.__timer.schedule(time.time() + delay, self.__send_hedge, race)
+
+        n, ok, value = race.result(0)
+        taken = 1
+        if not ok:
+            with race.lock:
+                hedged = race.hedged
+                race.decided = not hedged
+            if hedged:
+                # The first attempt to finish failed; let the other decide.
+                n, ok, value = race.result(1)
+                taken = 2
+
+        race.decide(taken)
+
+        if not ok:
+            raise value[0], value[1], value[2]
+
+        if n == 1:
+            with self.__lock:
+                self.hedges_won += 1
+        return value
+
+    def close(self):
+        pool = self.__pool.discard()
+        if pool is not None:
+            pool.close()
+
+    def stats(self):
+        with self.__lock:
+            return {
+                'requests': self.requests,
+                'hedges_sent': self.hedges_sent,
+                'hedges_won': self.hedges_won,
+                'hedges_inflight': self.__inflight,
+                'delay': self.delay(),
+            }
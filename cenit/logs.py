@@ -0,0 +1,94 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  logs.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+import logging
+
+
+MAX_LENGTH = 1000
+
+REDACTED = "<redacted>"
+SECRET_HEADERS = ('X-User-Access-Token', 'Authorization')
+SECRET_FIELDS = ('token', 'secret', 'password')
+
+_SECRET_HEADERS = frozenset(h.lower() for h in SECRET_HEADERS)
+
+
+class _Lazy(object):
+    """Renders its value only if a handler ends up formatting the record"""
+
+    __slots__ = ('render', 'args')
+
+    def __init__(self, render, *args):
+        self.render = render
+        self.args = args
+
+    def __str__(self):
+        return self.render(*self.args)
+
+    __repr__ = __str__
+
+
+def truncate(text, limit=MAX_LENGTH):
+    if limit is None or len(text) <= limit:
+        return text
+    return "%s... (%d more chars)" % (text[:limit], len(text) - limit)
+
+
+def _is_secret_header(name):
+    return isinstance(name, basestring) and name.lower() in _SECRET_HEADERS
+
+
+def mask(value):
+    """A copy of value with secret fields redacted, at any depth"""
+    if isinstance(value, dict):
+        secret_pair = _is_secret_header(value.get('key'))
+        return dict(
+            (k, REDACTED if k in SECRET_FIELDS or _is_secret_header(k) or
+             (secret_pair and k == 'value') else mask(v))
+            for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [mask(v) for v in value]
+    return value
+
+
+def _payload(value, limit):
+    return truncate(repr(mask(value)), limit)
+
+
+def _headers(headers):
+    return repr(dict((k, REDACTED if _is_secret_header(k) else v)
+                     for k, v in headers.items()))
+
+
+def payload(value, limit=MAX_LENGTH):
+    """value, masked and truncated to limit characters once logged"""
+    return _Lazy(_payload, value, limit)
+
+
+def headers(values):
+    """values with secret headers redacted once logged"""
+    return _Lazy(_headers, values)
+
+
+logging.getLogger("cenit").addHandler(logging.NullHandler())
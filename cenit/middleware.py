@@ -0,0 +1,258 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  middleware.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+import binascii
+import os
+import re
+import threading
+from bisect import bisect_left
+from collections import deque
+
+
+class Exchange(object):
+    """One attempt at an HTTP request, as seen by middleware"""
+
+    def __init__(self, method, url, endpoint, path, headers, attempt=0,
+                 stream=False, sent_bytes=0, trace=None):
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint
+        self.path = path
+        self.headers = headers
+        self.attempt = attempt
+        self.stream = stream
+        self.sent_bytes = sent_bytes
+        self.trace = trace
+
+        self.start = None
+        self.elapsed = None
+
+
+class Middleware(object):
+    """Hooks run around every request the client sends"""
+
+    def before_request(self, exchange):
+        pass
+
+    def after_response(self, exchange, response):
+        pass
+
+    def on_error(self, exchange, error):
+        pass
+
+
+_ID = re.compile(r'^([0-9a-fA-F]{24}|\d+)$')
+
+
+def route(method, path):
+    """method and path with record ids folded, e.g. GET setup/library/:id"""
+    return "%s %s" % (method, "/".join(
+        ":id" if _ID.match(part) else part for part in path.split("/")))
+
+
+class Histogram(object):
+    """Counts of values falling under each of a fixed set of bounds"""
+
+    # Milliseconds.
+    BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000,
+              30000, 60000)
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th value"""
+        if not self.count:
+            return None
+        rank = p * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'buckets': dict(zip(self.bounds + ('inf',), self.counts)),
+        }
+
+
+class _Route(object):
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.statuses = {}
+        self.errors = {}
+        self.retries = 0
+        self.revalidated = 0
+        self.sent_bytes = 0
+        self.received_bytes = 0
+
+    def snapshot(self):
+        return {
+            'latency_ms': self.latency.snapshot(),
+            'statuses': dict(self.statuses),
+            'errors': dict(self.errors),
+            'retries': self.retries,
+            'revalidated': self.revalidated,
+            'sent_bytes': self.sent_bytes,
+            'received_bytes': self.received_bytes,
+        }
+
+
+class Metrics(Middleware):
+    """Latency, status, byte and retry counts per route and endpoint"""
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.__lock:
+            self.__routes = {}
+            self.__endpoints = {}
+
+    def __route(self, exchange):
+        key = route(exchange.method, exchange.path)
+        stats = self.__routes.get(key)
+        if stats is None:
+            stats = self.__routes[key] = _Route()
+        return stats
+
+    def __count(self, exchange):
+        self.__endpoints[exchange.endpoint] = \
+            self.__endpoints.get(exchange.endpoint, 0) + 1
+
+        stats = self.__route(exchange)
+        stats.latency.add(exchange.elapsed * 1000)
+        stats.sent_bytes += exchange.sent_bytes
+        if exchange.attempt:
+            stats.retries += 1
+        return stats
+
+    def after_response(self, exchange, response):
+        received = 0 if exchange.stream else response.raw.tell()
+        with self.__lock:
+            stats = self.__count(exchange)
+            stats.statuses[response.status_code] = \
+                stats.statuses.get(response.status_code, 0) + 1
+            if response.status_code == 304:
+                stats.revalidated += 1
+            stats.received_bytes += received
+
+    def on_error(self, exchange, error):
+        name = type(error).__name__
+        with self.__lock:
+            stats = self.__count(exchange)
+            stats.errors[name] = stats.errors.get(name, 0) + 1
+
+    def snapshot(self, client=None):
+        """Counters so far; with client, also its caches and limits"""
+        with self.__lock:
+            rc = {
+                'routes': dict((k, v.snapshot())
+                               for k, v in self.__routes.items()),
+                'endpoints': dict(self.__endpoints),
+            }
+
+        if client is not None:
+            rc['traffic'] = client.get_traffic().stats()
+            rc['endpoint_pool'] = client.get_endpoints().stats()
+            for name in ('response_cache', 'query_cache', 'single_flight',
+                         'scheduler', 'hedger'):
+                component = getattr(client, 'get_' + name)()
+                if component is not None:
+                    rc[name] = component.stats()
+        return rc
+
+
+def _hex_id(size):
+    return binascii.hexlify(os.urandom(size))
+
+
+class Tracing(Middleware):
+    """Send each request as a span with a W3C traceparent header"""
+
+    HEADER = 'traceparent'
+
+    DEFAULT_MAX_SPANS = 1000
+
+    def __init__(self, max_spans=DEFAULT_MAX_SPANS, on_span=None):
+        self.on_span = on_span
+
+        self.__spans = deque(maxlen=max_spans)
+        self.__lock = threading.Lock()
+
+    def before_request(self, exchange):
+        if exchange.trace is None:
+            exchange.trace = (_hex_id(16), None)
+        exchange.span_id = _hex_id(8)
+        exchange.headers[self.HEADER] = "00-%s-%s-01" % (exchange.trace[0],
+                                                         exchange.span_id)
+
+    def __finish(self, exchange, status=None, error=None):
+        span = {
+            'trace_id': exchange.trace[0],
+            'span_id': exchange.span_id,
+            'parent_id': exchange.trace[1],
+            'name': route(exchange.method, exchange.path),
+            'endpoint': exchange.endpoint,
+            'attempt': exchange.attempt,
+            'start': exchange.start,
+            'duration': exchange.elapsed,
+            'status': status,
+            'error': error,
+        }
+        with self.__lock:
+            self.__spans.append(span)
+        if self.on_span is not None:
+            self.on_span(span)
+
+    def after_response(self, exchange, response):
+        self.__finish(exchange, status=response.status_code)
+
+    def on_error(self, exchange, error):
+        self.__finish(exchange, error=type(error).__name__)
+
+    def snapshot(self):
+        """Finished spans, oldest first"""
+        with self.__lock:
+            return list(self.__spans)
@@ -22,7 +22,13 @@
 #
 #
 
-from .api import CenitModel
+import logging
+
+from .api import CenitModel, intern_string
+from . import logs
+
+
+_logger = logging.getLogger(__name__)
 
 
 ################################################################################
@@ -40,6 +46,7 @@ class Library(CenitModel):
 
     root = 'library'
     properties = ['id', 'name', 'slug']
+    __slots__ = ('__schemas', '__data_types', 'slug')
 
     def __init__(self, name, slug=None, id_=None):
         super(Library, self).__init__(name, id_=id_)
@@ -126,7 +133,7 @@ class Library(CenitModel):
 
         rc = data_type in self.__data_types
         if rc:
-            print "\tRemoving %s" % (data_type, )
+            _logger.debug("Removing %s", data_type)
             self.__data_types.remove(data_type)
         return rc
 
@@ -162,6 +169,7 @@ class Schema(CenitModel):
 
     root = 'schema'
     properties = ['id', 'library', 'uri', 'schema']
+    __slots__ = ('__library', 'uri', 'schema')
 
     def __init__(self, library, uri, schema, id_=None):
         super(Schema, self).__init__(uri, id_=id_, namespace=library.name)
@@ -206,6 +214,7 @@ class Schema(CenitModel):
 class DataType(CenitModel):
 
     root = 'data_type'
+    __slots__ = ('__library', 'slug', 'title', '_type')
 
     def __init__(self, library, name, title=None, slug=None, id_=None):
         super(DataType, self).__init__(name, id_=id_, namespace=library.name)
@@ -255,6 +264,7 @@ class DataType(CenitModel):
 class SchemaDataType(DataType):
     root = 'schema_data_type'
     properties = ['id', 'library', 'name', 'schema', 'title', 'slug', '_type']
+    __slots__ = ('schema',)
 
     def __init__(self, library, name, schema, title=None, slug=None, id_=None):
         super(SchemaDataType, self).__init__(library, name, title=title,
@@ -285,6 +295,8 @@ class SchemaDataType(DataType):
 
 class FileDataType(DataType):
     root = 'file_data_type'
+    properties = ['id', 'library', 'name', 'title', 'slug', '_type']
+    __slots__ = ()
 
     def __init__(self, library, name, title=None, slug=None, id_=None):
         super(FileDataType, self).__init__(library, name, title=title,
@@ -319,11 +331,12 @@ class FileDataType(DataType):
 class Parameter(CenitModel):
     root = 'parameter'
     properties = ['id', 'key', 'value']
+    __slots__ = ('key', 'value')
 
     def __init__(self, key, value, id_=None):
         super(Parameter, self).__init__(key, id_=id_)
 
-        self.key = key
+        self.key = intern_string(key)
         self.value = value
 
     @classmethod
@@ -352,6 +365,8 @@ class Connection(CenitModel):
     root = "connection"
     properties = ['id', 'namespace', 'name', 'url', 'number', 'token',
                   'parameters', 'headers', 'template_parameters']
+    __slots__ = ('__parameters', '__headers', '__template_parameters',
+                 '__connection_roles', 'url', 'number', 'token')
 
     def __init__(self, name, url, namespace=None, parameters=None, headers=None,
                  template_parameters=None, id_=None, number=None, token=None):
@@ -512,6 +527,8 @@ class WebhookMethod:
 class Webhook(CenitModel):
     root = "webhook"
     properties = ['id', 'namespace', 'name', 'path', 'method']
+    __slots__ = ('path', '__method', '__parameters', '__headers',
+                 '__template_parameters', '__connection_roles')
 
     def __init__(self, name, path, method, namespace=None, parameters=None,
                  headers=None, template_parameters=None, id_=None):
@@ -537,7 +554,7 @@ class Webhook(CenitModel):
     def method(self, value):
         assert value in vars(WebhookMethod).values(), \
             "'Method' must be one of %s" % (WebhookMethod,)
-        self.__method = value
+        self.__method = intern_string(value)
 
     @property
     def parameters(self):
@@ -664,6 +681,7 @@ class Webhook(CenitModel):
 class ConnectionRole(CenitModel):
     root = "connection_role"
     properties = ['id', 'namespace', 'name', 'webhooks', 'connections']
+    __slots__ = ('__webhooks', '__connections')
 
     def __init__(self, name, namespace=None, webhooks=None, connections=None,
                  id_=None):
@@ -788,6 +806,7 @@ class ConnectionRole(CenitModel):
 
 class Event(CenitModel):
     root = "event"
+    __slots__ = ('_type',)
 
     def __init__(self, name, namespace=None, id_=None):
         super(Event, self).__init__(name, namespace=namespace, id_=id_)
@@ -796,7 +815,7 @@ class Event(CenitModel):
 
     @classmethod
     def from_values(cls, values):
-        print values
+        _logger.debug("Event values: %s", logs.payload(values))
 
     def _del(self):
         pass
@@ -805,6 +824,7 @@ class Event(CenitModel):
 class Observer(Event):
     root = "observer"
     properties = ['id', 'namespace', 'name', 'data_type', 'triggers']
+    __slots__ = ('__data_type', 'triggers')
 
     def __init__(self, name, data_type, triggers, namespace=None, id_=None):
         super(Observer, self).__init__(name, namespace=namespace, id_=id_)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  profiling.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+"""Opt-in profiling of the model layer, per class and operation"""
+
+import functools
+import threading
+import time
+
+from .api import CenitModel
+
+
+OPERATIONS = ('fetch', 'push', 'from_values', '__init__', 'to_dict')
+
+_lock = threading.Lock()
+_stats = {}
+_patched = []
+
+
+class _Thread(threading.local):
+
+    def __init__(self):
+        self.stack = []
+        self.created = 0
+
+
+_thread = _Thread()
+
+
+class _Frame(object):
+
+    __slots__ = ('target', 'operation', 'start', 'created', 'nested')
+
+    def __init__(self, target, operation, start, created):
+        self.target = target
+        self.operation = operation
+        self.start = start
+        self.created = created
+        self.nested = 0.0
+
+
+def _record(cls_name, operation, elapsed, own, objects):
+    key = (cls_name, operation)
+    with _lock:
+        stats = _stats.get(key)
+        if stats is None:
+            stats = _stats[key] = [0, 0.0, 0.0, 0]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] += own
+        stats[3] += objects
+
+
+def _wrap(func, operation):
+    @functools.wraps(func)
+    def _profiled(target, *args, **kwargs):
+        frames = _thread.stack
+        if frames and frames[-1].target is target and \
+                frames[-1].operation == operation:
+            # A super() call; the outermost call accounts for it.
+            return func(target, *args, **kwargs)
+
+        created = operation == '__init__'
+        _thread.created += created
+
+        frame = _Frame(target, operation, time.time(), _thread.created)
+        frames.append(frame)
+        try:
+            return func(target, *args, **kwargs)
+        finally:
+            frames.pop()
+            elapsed = time.time() - frame.start
+            if frames:
+                frames[-1].nested += elapsed
+
+            cls = target if isinstance(target, type) else type(target)
+            _record(cls.__name__, operation, elapsed, elapsed - frame.nested,
+                    _thread.created - frame.created + created)
+    return _profiled
+
+
+def _model_classes():
+    seen, pending = [], [CenitModel]
+    while pending:
+        cls = pending.pop()
+        if cls not in seen:
+            seen.append(cls)
+            pending.extend(cls.__subclasses__())
+    return seen
+
+
+def _patch(cls, name, value):
+    _patched.append((cls, name, cls.__dict__[name]))
+    setattr(cls, name, value)
+
+
+def enable():
+    """Start profiling every CenitModel subclass defined so far"""
+    if _patched:
+        return
+    for cls in _model_classes():
+        for name, attr in cls.__dict__.items():
+            if name in OPERATIONS:
+                if isinstance(attr, classmethod):
+                    _patch(cls, name, classmethod(_wrap(attr.__func__,
+                                                        name)))
+                elif callable(attr):
+                    _patch(cls, name, _wrap(attr, name))
+            elif isinstance(attr, property) and attr.fset is not None:
+                _patch(cls, name, property(
+                    attr.fget, _wrap(attr.fset, "set " + name),
+                    attr.fdel, attr.__doc__))
+
+
+def disable():
+    """Stop profiling; what was recorded is kept until reset()"""
+    while _patched:
+        cls, name, original = _patched.pop()
+        setattr(cls, name, original)
+
+
+def is_enabled():
+    return bool(_patched)
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def report():
+    """One entry per class and operation, by descending self time"""
+    with _lock:
+        rows = [{
+            'class': cls_name,
+            'operation': operation,
+            'calls': calls,
+            'cumulative': cumulative,
+            'self': own,
+            'objects': objects,
+        } for (cls_name, operation), (calls, cumulative, own, objects)
+            in _stats.items()]
+    return sorted(rows, key=lambda r: -r['self'])
+
+
+def format_report(limit=None):
+    lines = ["%-20s %-18s %9s %11s %11s %9s" % (
+        "class", "operation", "calls", "cumulative", "self", "objects")]
+    for row in report()[:limit]:
+        lines.append("%-20s %-18s %9d %10.3fs %10.3fs %9d" % (
+            row['class'], row['operation'], row['calls'], row['cumulative'],
+            row['self'], row['objects']))
+    return "\n".join(lines)
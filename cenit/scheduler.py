@@ -0,0 +1,187 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  scheduler.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+import threading
+import time
+
+
+INTERACTIVE = 0
+BULK = 1
+
+THROTTLED = (429, 503)
+
+
+class TokenBucket(object):
+    """Tokens refilled at rate per second, holding at most burst of them"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+
+        self.tokens = self.burst
+        self.stamp = time.time()
+        self.paused_until = 0
+
+    def take(self, reserve=0.0):
+        """Take a token above reserve: 0 if taken, else the seconds to wait"""
+        now = time.time()
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+        if self.tokens >= 1 + reserve:
+            self.tokens -= 1
+            return 0
+        return (1 + reserve - self.tokens) / self.rate
+
+
+class _Lane(object):
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.condition = threading.Condition()
+        self.waiting = {INTERACTIVE: 0, BULK: 0}
+        self.throttled = 0
+        self.adjusted = time.time()
+        self.cut = 0
+
+
+class RequestScheduler(object):
+    """Rate limit requests per key (host and tenant) in two priority lanes"""
+
+    DEFAULT_RATE = 50
+
+    def __init__(self, rate=DEFAULT_RATE, burst=None, bulk_reserve=0.2,
+                 min_rate=1, backoff=0.7, recovery=0.1, slow_latency=None,
+                 max_retries=3):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, self.rate / 10))
+        self.bulk_reserve = bulk_reserve * self.burst
+        self.min_rate = float(min_rate)
+        self.backoff = backoff
+        self.recovery = recovery
+        self.slow_latency = slow_latency
+        self.max_retries = max_retries
+
+        self.__lanes = {}
+        self.__lock = threading.Lock()
+
+        self.__requests = {INTERACTIVE: 0, BULK: 0}
+        self.__waited = {INTERACTIVE: 0.0, BULK: 0.0}
+        self.__max_wait = {INTERACTIVE: 0.0, BULK: 0.0}
+
+    def __get_lane(self, key):
+        with self.__lock:
+            if key not in self.__lanes:
+                bucket = TokenBucket(self.rate, self.burst)
+                self.__lanes[key] = _Lane(bucket)
+            return self.__lanes[key]
+
+    def acquire(self, key, priority=INTERACTIVE, timeout=None):
+        """Wait for a token of key; False if none came within timeout"""
+        lane = self.__get_lane(key)
+        reserve = self.bulk_reserve if priority == BULK else 0.0
+        start = time.time()
+
+        with lane.condition:
+            lane.waiting[priority] += 1
+            try:
+                while True:
+                    if priority == BULK and lane.waiting[INTERACTIVE]:
+                        wait = 1.0 / lane.bucket.rate
+                    else:
+                        wait = lane.bucket.take(reserve)
+                        if not wait:
+                            break
+
+                    if timeout is not None:
+                        left = start + timeout - time.time()
+                        if left <= 0:
+                            return False
+                        wait = min(wait, left)
+                    lane.condition.wait(wait)
+            finally:
+                lane.waiting[priority] -= 1
+                if priority == INTERACTIVE:
+                    lane.condition.notify_all()
+
+        waited = time.time() - start
+        with self.__lock:
+            self.__requests[priority] += 1
+            self.__waited[priority] += waited
+            self.__max_wait[priority] = max(self.__max_wait[priority],
+                                            waited)
+        return True
+
+    def feedback(self, key, status, latency, retry_after=None):
+        """Adapt the rate of key to a response; True if it should be retried"""
+        lane = self.__get_lane(key)
+        bucket = lane.bucket
+
+        with lane.condition:
+            now = time.time()
+            elapsed, lane.adjusted = now - lane.adjusted, now
+
+            if status in THROTTLED:
+                lane.throttled += 1
+                # Requests sent before the last cut report the same
+                # congestion; reacting to each of them would compound it.
+                if now - latency >= lane.cut:
+                    lane.cut = now
+                    bucket.rate = max(self.min_rate,
+                                      bucket.rate * self.backoff)
+                bucket.tokens = min(bucket.tokens, 0)
+                try:
+                    pause = float(retry_after or 0)
+                except ValueError:
+                    pause = 0
+                bucket.paused_until = now + max(pause, 1.0 / bucket.rate)
+                return True
+
+            if self.slow_latency and latency > self.slow_latency:
+                bucket.rate = max(self.min_rate, bucket.rate * 0.9)
+            else:
+                bucket.rate = min(self.rate, bucket.rate +
+                                  self.rate * self.recovery * elapsed)
+        return False
+
+    def stats(self):
+        with self.__lock:
+            lanes = dict(self.__lanes)
+            rc = {
+                'requests': dict(self.__requests),
+                'waited': dict(self.__waited),
+                'max_wait': dict(self.__max_wait),
+            }
+
+        rc['keys'] = {}
+        for key, lane in lanes.items():
+            rc['keys'][key] = {
+                'rate': lane.bucket.rate,
+                'throttled': lane.throttled,
+            }
+        return rc
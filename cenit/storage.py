@@ -0,0 +1,300 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*-
+#
+#  storage.py
+#
+#  Copyright 2015 D.H. Bahr <dhbahr@gmail.com>
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software
+#  Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#  MA 02110-1301, USA.
+#
+#
+
+import logging
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import simplejson
+
+from .api import CenitModel, Storage
+from .forks import PerProcess
+
+
+_logger = logging.getLogger(__name__)
+
+
+class BoundedStorage(Storage):
+    """Identity map holding a bounded number of instances"""
+
+    DEFAULT_MAX_INSTANCES = 10000
+
+    def __init__(self, max_instances=DEFAULT_MAX_INSTANCES,
+                 max_per_class=None, weak=True):
+        self.max_instances = max_instances
+        self.max_per_class = max_per_class
+        self.weak = weak
+
+        self.__instances = OrderedDict()
+        self.__classes = {}
+        self.__weak = {}
+        self.__lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __forget(self, cls, key):
+        instance = self.__instances.pop((cls, key), None)
+        if instance is not None:
+            self.__classes[cls].pop(key)
+        return instance
+
+    def __remember(self, cls, key, instance):
+        self.__forget(cls, key)
+        self.__instances[(cls, key)] = instance
+        self.__classes.setdefault(cls, OrderedDict())[key] = instance
+
+        if self.weak:
+            self.__weak.setdefault(cls, weakref.WeakValueDictionary())
+            self.__weak[cls][key] = instance
+
+        if self.max_per_class:
+            keys = self.__classes[cls]
+            while len(keys) > self.max_per_class:
+                self.__forget(cls, next(iter(keys)))
+                self.evictions += 1
+
+        while len(self.__instances) > self.max_instances:
+            self.__forget(*next(iter(self.__instances)))
+            self.evictions += 1
+
+    def drop_instance(self, cls, key):
+        with self.__lock:
+            self.__forget(cls, key)
+            self.__weak.get(cls, {}).pop(key, None)
+
+    def get_instance(self, cls, key):
+        with self.__lock:
+            instance = self.__forget(cls, key)
+            if instance is None and self.weak:
+                instance = self.__weak.get(cls, {}).get(key, None)
+
+            if instance is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.__remember(cls, key, instance)
+            return instance
+
+    def set_instance(self, cls, key, instance):
+        assert issubclass(cls, CenitModel), \
+            "Class %s must be subclass of CenitModel" % (cls,)
+        assert isinstance(instance, CenitModel), \
+            "Object %s must be instance of CenitModel" % (instance,)
+
+        with self.__lock:
+            self.__remember(cls, key, instance)
+
+    def stats(self):
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.__instances),
+                'weak_size': sum(len(x) for x in self.__weak.values()),
+                'classes': dict((cls.__name__, len(keys))
+                                for cls, keys in self.__classes.items()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+            }
+
+
+class SqliteStorage(Storage):
+    """Identity map persisted to a local sqlite database"""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS instances (
+            model TEXT NOT NULL,
+            key TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            stamp REAL NOT NULL,
+            state TEXT NOT NULL,
+            PRIMARY KEY (model, key)
+        )
+    """
+
+    def __init__(self, path, memory=None):
+        self.path = path
+
+        self.__memory = memory or BoundedStorage()
+        self.__dirty = OrderedDict()
+        self.__loading = threading.local()
+        self.__lock = threading.RLock()
+
+        self.__db = PerProcess(self.__connect)
+
+        self.skipped = 0
+
+    @staticmethod
+    def _model(cls):
+        return "{}.{}".format(cls.__module__, cls.__name__)
+
+    @staticmethod
+    def _class(model):
+        module, _, name = model.rpartition(".")
+        return getattr(sys.modules[module], name)
+
+    # sqlite connections must not cross os.fork(), so a child process opens
+    # its own.
+    def __connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute(self._SCHEMA)
+        db.commit()
+        return db
+
+    def __rehydrate(self, model, key, state):
+        """Instances rebuilt from a stored row; None if it cannot be"""
+        self.__loading.active = True
+        try:
+            rc = self._class(model).from_values([simplejson.loads(state)])
+            if rc is None:
+                raise TypeError("from_values() returned None")
+            return rc
+        except Exception as e:
+            _logger.warning("Skipping stored %s %s: %s", model, key, e)
+            with self.__lock:
+                self.skipped += 1
+            return None
+        finally:
+            self.__loading.active = False
+
+    def drop_instance(self, cls, key):
+        with self.__lock:
+            self.__memory.drop_instance(cls, key)
+            self.__dirty.pop((cls, key), None)
+
+            db = self.__db.get()
+            db.execute("DELETE FROM instances WHERE model = ? AND key = ?",
+                       (self._model(cls), key))
+            db.commit()
+
+    def get_instance(self, cls, key):
+        instance = self.__memory.get_instance(cls, key)
+        if instance is not None or key is None:
+            return instance
+
+        model = self._model(cls)
+        with self.__lock:
+            row = self.__db.get().execute(
+                "SELECT state FROM instances WHERE model = ? AND key = ?",
+                (model, key)).fetchone()
+
+        if row is None or self.__rehydrate(model, key, row[0]) is None:
+            return None
+        return self.__memory.get_instance(cls, key)
+
+    def set_instance(self, cls, key, instance):
+        self.__memory.set_instance(cls, key, instance)
+        if cls.properties and not getattr(self.__loading, 'active', False):
+            with self.__lock:
+                self.__dirty[(cls, key)] = instance
+
+    def flush(self):
+        with self.__lock:
+            dirty, self.__dirty = self.__dirty, OrderedDict()
+            if not dirty:
+                return
+
+            db = self.__db.get()
+            now = time.time()
+            for (cls, key), instance in dirty.items():
+                model = self._model(cls)
+                # Nested models are stored whole: from_values cannot resolve
+                # a bare reference back into one.
+                state = simplejson.dumps(instance.to_dict(expand=True),
+                                         sort_keys=True)
+
+                # Updating in place keeps the rowid of the first insert, so
+                # load() replays records in the order they were first seen,
+                # referenced objects before the ones referencing them.
+                updated = db.execute(
+                    "UPDATE instances "
+                    "SET version = version + 1, stamp = ?, state = ? "
+                    "WHERE model = ? AND key = ? AND state != ?",
+                    (now, state, model, key, state)).rowcount
+                if not updated:
+                    db.execute(
+                        "INSERT OR IGNORE INTO instances "
+                        "(model, key, version, stamp, state) "
+                        "VALUES (?, ?, 1, ?, ?)",
+                        (model, key, now, state))
+            db.commit()
+
+    def load(self, *classes):
+        """Rehydrate every stored instance of classes (or of all classes)"""
+        query = "SELECT model, key, state FROM instances"
+        params = [self._model(cls) for cls in classes]
+        if params:
+            query += " WHERE model IN (%s)" % (", ".join("?" * len(params)),)
+        query += " ORDER BY rowid"
+
+        with self.__lock:
+            rows = self.__db.get().execute(query, params).fetchall()
+
+        count = 0
+        for model, key, state in rows:
+            count += len(self.__rehydrate(model, key, state) or ())
+        return count
+
+    def get_version(self, cls, key):
+        with self.__lock:
+            row = self.__db.get().execute(
+                "SELECT version, stamp FROM instances "
+                "WHERE model = ? AND key = ?",
+                (self._model(cls), key)).fetchone()
+        return row and tuple(row)
+
+    def last_stamp(self, cls):
+        """Time of the latest change stored for cls, to fetch deltas from"""
+        with self.__lock:
+            row = self.__db.get().execute(
+                "SELECT MAX(stamp) FROM instances WHERE model = ?",
+                (self._model(cls),)).fetchone()
+        return row[0]
+
+    def close(self):
+        with self.__lock:
+            db = self.__db.discard()
+            if db is not None:
+                db.close()
+
+    def stats(self):
+        with self.__lock:
+            rows = self.__db.get().execute(
+                "SELECT model, COUNT(*) FROM instances GROUP BY model")
+            rc = {
+                'stored': dict(rows.fetchall()),
+                'dirty': len(self.__dirty),
+                'skipped': self.skipped,
+            }
+        if hasattr(self.__memory, 'stats'):
+            rc['memory'] = self.__memory.stats()
+        return rc